@@ -1,10 +1,12 @@
 from __future__ import annotations
 import djlib.djlib as dj
 import json
+import numbers
 import os
 import numpy as np
-from scipy.spatial import ConvexHull
+from scipy.spatial import ConvexHull, Delaunay
 from scipy.interpolate import griddata
+from scipy.sparse import csr_matrix
 from sklearn.metrics import mean_squared_error
 from glob import glob
 import pickle
@@ -114,38 +116,170 @@ def lower_hull(hull: ConvexHull, energy_index=-2) -> Tuple[np.ndarray, np.ndarra
     # Note: energy_index is used on the "hull.equations" output, which has a scalar offset.
     # (If your energy is the last column of "points", either use the direct index, or use "-2". Using "-1" as energy_index will not give the proper lower hull.)
     lower_hull_simplices = hull.simplices[hull.equations[:, energy_index] < 0]
-    lower_hull_vertices = np.unique(np.ravel(lower_hull_simplices))
+    # np.unique flattens its input; reshape(-1) is a view of the C-contiguous simplex block.
+    lower_hull_vertices = np.unique(lower_hull_simplices.reshape(-1))
     return (lower_hull_vertices, lower_hull_simplices)
 
 
+def uncalculated_energies_to_nan(formation_energy: np.ndarray) -> np.ndarray:
+    """Converts formation energies from a casm query to a float vector, with NaN for configurations that have not been calculated.
+    Parameters
+    ----------
+        formation_energy : numpy.ndarray shape(number_configurations,)
+            Formation energies. Uncalculated configurations may be {} (casm 1.1.2) or None (casm 1.2).
+            Any real number, including numpy scalars, is a calculated energy.
+    Returns
+    -------
+        formation_energy : numpy.ndarray shape(number_configurations,)
+            Formation energies as floats, NaN where uncalculated.
+    """
+    formation_energy = np.asarray(formation_energy)
+    if formation_energy.dtype == object:
+        return np.array(
+            [
+                energy
+                if isinstance(energy, numbers.Real) and not isinstance(energy, bool)
+                else np.nan
+                for energy in formation_energy
+            ],
+            dtype=float,
+        )
+    return formation_energy.astype(float)
+
+
+def hull_interpolation_weights(
+    hull_comps: np.ndarray, test_comp: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the hull simplex containing each test composition and the barycentric weights of its corners.
+    The result depends only on compositions, so it can be computed once and reused for any set of hull energies.
+    Parameters
+    ----------
+        hull_comps : numpy.ndarray shape(number_hull_configurations, number_composition_axes)
+            Coordinate in composition space for all hull configurations.
+        test_comp : numpy.ndarray shape(number_test_configurations, number_composition_axes)
+            Coordinate in composition space for each configuration to test.
+    Returns
+    -------
+        simplex_vertex_indices : numpy.ndarray of ints, shape(number_test_configurations, number_composition_axes + 1)
+            Indices (into hull_comps) of the corners of the simplex containing each test composition.
+        weights : numpy.ndarray shape(number_test_configurations, number_composition_axes + 1)
+            Barycentric weights of each corner. Rows are NaN for compositions outside of the hull.
+    """
+    hull_comps = np.asarray(hull_comps, dtype=float)
+    test_comp = np.asarray(test_comp, dtype=float)
+    if hull_comps.shape[1] == 1:
+        # Delaunay requires at least two dimensions; in 1D the simplices are intervals between sorted compositions.
+        order = np.argsort(hull_comps[:, 0])
+        sorted_comps = hull_comps[order, 0]
+        points = test_comp[:, 0]
+        right = np.clip(
+            np.searchsorted(sorted_comps, points, side="right"),
+            1,
+            sorted_comps.shape[0] - 1,
+        )
+        left = right - 1
+        right_weight = (points - sorted_comps[left]) / (
+            sorted_comps[right] - sorted_comps[left]
+        )
+        simplex_vertex_indices = np.column_stack((order[left], order[right]))
+        weights = np.column_stack((1 - right_weight, right_weight))
+        outside = (points < sorted_comps[0]) | (points > sorted_comps[-1])
+    else:
+        ndim = hull_comps.shape[1]
+        tri = Delaunay(hull_comps)
+        simplex_indices = tri.find_simplex(test_comp)
+        transform = tri.transform[simplex_indices]
+        partial_weights = np.einsum(
+            "nij,nj->ni", transform[:, :ndim], test_comp - transform[:, ndim]
+        )
+        simplex_vertex_indices = tri.simplices[simplex_indices]
+        weights = np.column_stack((partial_weights, 1 - partial_weights.sum(axis=1)))
+        outside = simplex_indices < 0
+    weights[outside] = np.nan
+    return (simplex_vertex_indices, weights)
+
+
+def hull_interpolation_matrix(
+    hull_comps: np.ndarray, test_comp: np.ndarray
+) -> csr_matrix:
+    """Sparse matrix that linearly interpolates hull energies onto test compositions.
+    Multiplying it with a vector (or matrix, one column per ECI set) of hull energies gives the hull energy at each test composition.
+    Parameters
+    ----------
+        hull_comps : numpy.ndarray shape(number_hull_configurations, number_composition_axes)
+            Coordinate in composition space for all hull configurations.
+        test_comp : numpy.ndarray shape(number_test_configurations, number_composition_axes)
+            Coordinate in composition space for each configuration to test.
+    Returns
+    -------
+        interpolation_matrix : scipy.sparse.csr_matrix shape(number_test_configurations, number_hull_configurations)
+            Barycentric weights of the simplex corners for each test composition. Rows are NaN for compositions outside of the hull.
+    """
+    simplex_vertex_indices, weights = hull_interpolation_weights(hull_comps, test_comp)
+    number_corners = simplex_vertex_indices.shape[1]
+    return csr_matrix(
+        (
+            np.ravel(weights),
+            np.ravel(simplex_vertex_indices),
+            np.arange(0, weights.size + 1, number_corners),
+        ),
+        shape=(weights.shape[0], np.shape(hull_comps)[0]),
+    )
+
+
 def checkhull(
     hull_comps: np.ndarray,
     hull_energies: np.ndarray,
     test_comp: np.ndarray,
     test_energy: np.ndarray,
+    interpolation_matrix: csr_matrix = None,
 ) -> np.ndarray:
     """Calculates hull distance for each configuration
     Parameters
     ----------
         hull_comps : numpy.ndarray shape(number_configurations, number_composition_axes)
             Coordinate in composition space for all configurations.
-        hull_energies : numpy.ndarray shape(number_configurations,)
-            Formation energy for each configuration.
+        hull_energies : numpy.ndarray shape(number_configurations,) or shape(number_configurations, number_eci_sets)
+            Formation energy for each configuration. Each column is treated as a separate set of hull energies.
+        test_comp : numpy.ndarray shape(number_test_configurations, number_composition_axes)
+            Coordinate in composition space for each configuration to test.
+        test_energy : numpy.ndarray shape(number_test_configurations,) or shape(number_test_configurations, number_eci_sets)
+            Formation energy for each configuration to test. Must have one column per column of hull_energies.
+        interpolation_matrix : scipy.sparse.csr_matrix, optional
+            Output of hull_interpolation_matrix(hull_comps, test_comp). When provided, the hull triangulation is not rebuilt.
     Returns
     -------
-        hull_dist : numpy.ndarray shape(number_of_configurations,)
+        hull_dist : numpy.ndarray shape(number_test_configurations,) or shape(number_test_configurations, number_eci_sets)
             The distance of each configuration from the convex hull described by the current cluster expansion of DFT-determined convex hull configurations.
 
     """
-    # Need to reshape to column vector to work properly.
-    # Test comp should also be a column vector.
-    test_energy = np.reshape(test_energy, (-1, 1))
-    # Fit linear grid
-    interp_hull = griddata(hull_comps, hull_energies, test_comp, method="linear")
+    test_energy = np.asarray(test_energy)
+    if interpolation_matrix is None:
+        # Fit linear grid. griddata interpolates every column of hull_energies over a single triangulation.
+        interp_hull = griddata(hull_comps, hull_energies, test_comp, method="linear")
+    else:
+        interp_hull = interpolation_matrix @ hull_energies
+
+    # griddata adds a singleton axis for 1D compositions; match the shape of test_energy before subtracting.
+    interp_hull = np.reshape(interp_hull, test_energy.shape)
 
     # Check if the test_energy points are above or below the hull
     hull_dist = test_energy - interp_hull
-    return np.ravel(np.array(hull_dist))
+    return hull_dist
+
+
+@dj.cache_by_array_digest(maxsize=8)
+def _cached_lower_hull_vertices(
+    compositions: np.ndarray, energies: np.ndarray, qhull_options: str
+) -> np.ndarray:
+    """Lower convex hull vertices of compositions and energies.
+    Used by find_proposed_ground_states to avoid rebuilding the same DFT hull on every call.
+    """
+    hull = thull.full_hull(
+        compositions=compositions, energies=energies, qhull_options=qhull_options
+    )
+    lower_hull_vertices, _ = thull.lower_hull(hull)
+    return lower_hull_vertices
 
 
 def find_proposed_ground_states(
@@ -153,6 +287,9 @@ def find_proposed_ground_states(
     comp: np.ndarray,
     formation_energy: np.ndarray,
     eci_set: np.ndarray,
+    batch_size: int = 100,
+    tolerance: float = 1e-5,
+    qhull_options: str = "",
 ) -> np.ndarray:
     """Collects indices of configurations that fall 'below the cluster expansion prediction of DFT-determined hull configurations'.
 
@@ -170,11 +307,26 @@ def find_proposed_ground_states(
     eci_set: numpy.ndarray
         mxk matrix, m = number of monte carlo sampled ECI sets, k = number of ECI.
 
+    batch_size: int
+        Number of ECI sets evaluated per matrix multiply. Peak memory scales with n x batch_size. Default is 100.
+
+    tolerance: float
+        A configuration is only counted if it is more than tolerance (eV) below the hull, so that rounding noise does not flag the hull configurations themselves. Default is 1e-5.
+
+    qhull_options: str
+        Options passed to Qhull when building the DFT convex hull.
+
 
     Returns
     -------
     proposed_ground_state_indices: numpy.ndarray
         Vector of indices denoting configurations which appeared below the DFT hull across all of the Monte Carlo steps.
+        Sorted by index; each index appears once for every ECI set in which the configuration was below the hull.
+
+    Notes
+    -----
+    Only the convex hull of DFT energies and the effective hull distance correlations are built in double precision. Hull distances are computed in single precision,
+    which halves the memory traffic of the (n x k) @ (k x batch_size) products; the resulting error (~1e-6 eV) is well below the default tolerance.
     """
 
     # Read data from casm query json output
@@ -183,56 +335,65 @@ def find_proposed_ground_states(
     # formation_energy = data["formation_energy"]
     # comp = data["comp"]
 
-    proposed_ground_states_indices = np.array([])
+    # Number of ECI sets for which each configuration falls below the hull
+    below_hull_counts = np.zeros(corr.shape[0], dtype=int)
 
     # Dealing with compatibility: Different descriptors for un-calculated formation energy (1.1.2->{}, 1.2-> null (i.e. None))
-    uncalculated_energy_descriptor = None
-    if {} in formation_energy:
-        uncalculated_energy_descriptor = {}
-
-    # Downsampling only the calculated configs:
-    downsample_selection = formation_energy != uncalculated_energy_descriptor
-    corr_calculated = corr[downsample_selection]
-    formation_energy_calculated = formation_energy[downsample_selection]
-    comp_calculated = comp[downsample_selection]
-
-    # Find and store correlations for DFT-predicted hull states:
-    points = np.zeros(
-        (formation_energy_calculated.shape[0], comp_calculated.shape[1] + 1)
+    formation_energy = uncalculated_energies_to_nan(formation_energy)
+
+    # Downsampling only the calculated configs.
+    calculated_indices = np.flatnonzero(~np.isnan(formation_energy))
+    corr_calculated = np.take(corr, calculated_indices, axis=0)
+    formation_energy_calculated = np.take(formation_energy, calculated_indices)
+    comp_calculated = np.take(
+        np.asarray(comp, dtype=float), calculated_indices, axis=0
     )
-    points[:, 0:-1] = comp_calculated
-    points[:, -1] = formation_energy_calculated
-    hull = ConvexHull(points)
-    dft_hull_config_indices, dft_hull_simplices = thull.lower_hull(hull)
-    dft_hull_corr = corr_calculated[dft_hull_config_indices]
-    dft_hull_vertices = hull.points[dft_hull_config_indices]
-
-    # Temporarily removed- requires too much memory
-    # sampled_hulldist = []
-
-    # Collect proposed ground state indices
-    for current_eci in eci_set:
-        full_predicted_energy = np.matmul(corr, current_eci)
-
-        # Predict energies of DFT-determined hull configs using current ECI selection
-        dft_hull_clex_predict_energies = np.matmul(dft_hull_corr, current_eci)
 
-        hulldist = checkhull(
-            dft_hull_vertices[:, 0:-1],
-            dft_hull_clex_predict_energies,
-            comp,
-            full_predicted_energy,
-        )
-
-        # Temporarily removed. Requires too much memory
-        # sampled_hulldist.append(hulldist)
-
-        # Find configurations that break the convex hull
-        below_hull_selection = hulldist < 0
-        below_hull_indices = np.ravel(np.array(below_hull_selection.nonzero()))
-        proposed_ground_states_indices = np.concatenate(
-            (proposed_ground_states_indices, below_hull_indices)
-        )
+    # Find and store correlations for DFT-predicted hull states. The hull is cached, since repeated calls usually share the same DFT data.
+    dft_hull_config_indices = _cached_lower_hull_vertices(
+        comp_calculated,
+        formation_energy_calculated,
+        qhull_options,
+    )
+    dft_hull_corr = corr_calculated[dft_hull_config_indices]
+    dft_hull_comps = comp_calculated[dft_hull_config_indices]
+
+    # Hull compositions are fixed across ECI sets: triangulate once and reuse the interpolation weights.
+    interpolation_matrix = hull_interpolation_matrix(dft_hull_comps, comp)
+
+    # Configurations outside of the hull (NaN interpolation rows) can never be below it; drop them before any matrix multiply.
+    inside_hull = np.flatnonzero(~np.isnan(np.ravel(interpolation_matrix.sum(axis=1))))
+    interpolation_matrix = interpolation_matrix[inside_hull]
+
+    # Hull distance is linear in the ECI: corr @ eci - W @ (dft_hull_corr @ eci) = (corr - W @ dft_hull_corr) @ eci.
+    # Forming the effective hull distance correlations once turns each batch into a single matrix multiply,
+    # with no separate interpolation, subtraction or intermediate energy matrices.
+    hulldist_corr = np.asarray(corr)[inside_hull] - interpolation_matrix @ dft_hull_corr
+
+    # Single precision is sufficient for a sign test against the hull.
+    hulldist_corr = hulldist_corr.astype(np.float32)
+    eci_set_single = np.asarray(eci_set, dtype=np.float32)
+
+    # Output buffers are reused across batches.
+    hulldist = np.empty((inside_hull.shape[0], batch_size), dtype=np.float32)
+    below_hull = np.empty((inside_hull.shape[0], batch_size), dtype=bool)
+
+    # Collect proposed ground state indices. ECI sets are evaluated in batches so that each
+    # batch is a single matrix multiply, rather than one matrix-vector product per ECI set.
+    for batch_start in range(0, eci_set_single.shape[0], batch_size):
+        eci_batch = eci_set_single[batch_start : batch_start + batch_size]
+        batch_hulldist = hulldist[:, : eci_batch.shape[0]]
+        batch_below_hull = below_hull[:, : eci_batch.shape[0]]
+        np.matmul(hulldist_corr, eci_batch.T, out=batch_hulldist)
+
+        # Tally configurations that break the convex hull
+        np.less(batch_hulldist, -tolerance, out=batch_below_hull)
+        below_hull_counts[inside_hull] += np.count_nonzero(batch_below_hull, axis=1)
+
+    # Each index is repeated once per ECI set that placed it below the hull, so np.bincount recovers the tally.
+    proposed_ground_states_indices = np.repeat(
+        np.arange(corr.shape[0]), below_hull_counts
+    )
     return proposed_ground_states_indices
 
 
@@ -386,7 +547,8 @@ def format_stan_executable_script(
     Parameters
     ----------
     data_file: string
-        Path to casm query output containing correlations, compositions and formation energies
+        Path to casm query output containing correlations, compositions and formation energies.
+        May also be a .npz file containing a "corr" matrix and an energy_tag vector.
     stan_model_file: string
         Path to text file containing stan model specifics
     eci_output_file: string
@@ -415,10 +577,7 @@ start_time = time.time()
 
 # Load Casm Data
 data_file = '$data_file'
-data = dj.casm_query_reader(data_file)
-corr = np.squeeze(np.array(data["corr"]))
-corr = tuple(map(tuple, corr))
-energies = tuple(data['$energy_tag'])
+$load_data
 
 #Format Stan Model
 n_configs = len(energies)
@@ -440,8 +599,22 @@ end_time = time.time()
 print("Run time is: ", end_time - start_time, " seconds")
 """
     )
+    if str(data_file).endswith(".npz"):
+        # Binary arrays written by np.savez, keyed by "corr" and the energy tag
+        load_data = Template(
+            """data = np.load(data_file)
+corr = data["corr"]
+energies = data['$energy_tag']"""
+        )
+    else:
+        load_data = Template(
+            """data = dj.casm_query_reader(data_file)
+corr = np.ascontiguousarray(np.squeeze(data["corr"]), dtype=np.float64)
+energies = np.asarray(data['$energy_tag'], dtype=np.float64)"""
+        )
     executable_file = template.substitute(
         data_file=data_file,
+        load_data=load_data.substitute(energy_tag=energy_tag),
         stan_model_file=stan_model_file,
         num_chains=int(num_chains),
         num_samples=int(num_samples),
@@ -451,8 +624,19 @@ print("Run time is: ", end_time - start_time, " seconds")
     return executable_file
 
 
+def _read_partition_file(path: str):
+    """Reads the correlations and energies of one training or testing partition written by cross_validate_stan_model.
+    The energies are stored under the energy tag of the run, which is the only key besides "corr".
+    """
+    with np.load(path) as partition:
+        (energy_tag,) = [key for key in partition.files if key != "corr"]
+        return partition["corr"], partition[energy_tag]
+
+
 def bayes_train_test_analysis(run_dir: str) -> dict:
     """Calculates training and testing rms for cross validated fitting.
+    Training and testing arrays are read from the training_data.npz and testing_data.npz files written with the run.
+    Runs without them fall back to parsing the original data source.
 
     Parameters:
     -----------
@@ -482,28 +666,37 @@ def bayes_train_test_analysis(run_dir: str) -> dict:
     # Load run information to access query data file and train / test indices
     with open(os.path.join(run_dir, "run_info.json"), "r") as f:
         run_info = json.load(f)
-    with open(run_info["data_source"], "r") as f:
-        query_data = np.array(json.load(f))
 
-    # Load training and testing data
-    testing_data = dj.casm_query_reader(
-        casm_query_json_data=query_data[run_info["test_set"]]
-    )
-    training_data = dj.casm_query_reader(
-        casm_query_json_data=query_data[run_info["training_set"]]
-    )
+    # cross_validate_stan_model writes each partition next to run_info.json; these are the arrays the run was fit to.
+    training_data_path = os.path.join(run_dir, "training_data.npz")
+    testing_data_path = os.path.join(run_dir, "testing_data.npz")
+    if os.path.isfile(training_data_path) and os.path.isfile(testing_data_path):
+        training_corr, training_energies = _read_partition_file(training_data_path)
+        testing_corr, testing_energies = _read_partition_file(testing_data_path)
+    else:
+        with open(run_info["data_source"], "r") as f:
+            query_data = np.array(json.load(f))
 
-    training_corr = np.squeeze(np.array(training_data["corr"]))
-    training_energies = np.array(training_data["formation_energy"])
+        # Load training and testing data
+        testing_data = dj.casm_query_reader(
+            casm_query_json_data=query_data[run_info["test_set"]]
+        )
+        training_data = dj.casm_query_reader(
+            casm_query_json_data=query_data[run_info["training_set"]]
+        )
 
-    testing_corr = np.squeeze(np.array(testing_data["corr"]))
-    testing_energies = np.array(testing_data["formation_energy"])
+        training_corr = np.squeeze(np.array(training_data["corr"]))
+        training_energies = np.array(training_data["formation_energy"])
+
+        testing_corr = np.squeeze(np.array(testing_data["corr"]))
+        testing_energies = np.array(testing_data["formation_energy"])
 
     with open(os.path.join(run_dir, "results.pkl"), "rb") as f:
         eci = pickle.load(f)["eci"]
 
-    train_data_predict = np.transpose(training_corr @ eci)
-    test_data_predict = np.transpose(testing_corr @ eci)
+    # Residuals for every ECI sample at once: one column per sample
+    training_residuals = training_corr @ eci - training_energies.reshape(-1, 1)
+    testing_residuals = testing_corr @ eci - testing_energies.reshape(-1, 1)
 
     # Calculate RMS on testing data using only the mean ECI values
     eci_mean = np.mean(eci, axis=1)
@@ -511,22 +704,8 @@ def bayes_train_test_analysis(run_dir: str) -> dict:
     eci_mean_rms = np.sqrt(mean_squared_error(testing_energies, eci_mean_prediction))
 
     # Calculate rms for training and testing datasets
-    training_rms = np.array(
-        [
-            np.sqrt(mean_squared_error(training_energies, train_data_predict[i]))
-            for i in range(train_data_predict.shape[0])
-        ]
-    )
-    testing_rms = np.array(
-        [
-            np.sqrt(mean_squared_error(testing_energies, test_data_predict[i]))
-            for i in range(test_data_predict.shape[0])
-        ]
-    )
-
-    # Collect parameters unique to this kfold run
-    with open(os.path.join(run_dir, "run_info.json"), "r") as f:
-        run_info = json.load(f)
+    training_rms = np.sqrt(np.mean(training_residuals ** 2, axis=0))
+    testing_rms = np.sqrt(np.mean(testing_residuals ** 2, axis=0))
 
     # Collect all run information in a single dictionary and return.
     kfold_data = {}
@@ -560,7 +739,8 @@ def kfold_analysis(kfold_dir: str) -> dict:
     train_rms_values = []
     test_rms_values = []
     eci_mean_testing_rms = []
-    eci_mean = None
+    eci_mean_sum = None
+    run_count = 0
     invalid_rhat_tally = []
 
     kfold_subdirs = glob(os.path.join(kfold_dir, "*"))
@@ -572,10 +752,12 @@ def kfold_analysis(kfold_dir: str) -> dict:
                 train_rms_values.append(np.mean(run_data["training_rms"]))
                 test_rms_values.append(np.mean(run_data["testing_rms"]))
                 eci_mean_testing_rms.append(run_data["eci_mean_testing_rms"])
-                if type(eci_mean) == type(None):
-                    eci_mean = run_data["eci_means"]
+                # Sum ECI means across runs; every run is weighted equally in the average below.
+                if eci_mean_sum is None:
+                    eci_mean_sum = np.array(run_data["eci_means"], dtype=float)
                 else:
-                    eci_mean = (eci_mean + run_data["eci_means"]) / 2
+                    eci_mean_sum += run_data["eci_means"]
+                run_count += 1
                 with open(os.path.join(run_dir, "results.pkl"), "rb") as f:
                     results = pickle.load(f)
                     rhat_check_results = rhat_check(results)
@@ -586,6 +768,7 @@ def kfold_analysis(kfold_dir: str) -> dict:
                 with open(os.path.join(run_dir, "run_info.json"), "w") as f:
                     json.dump(run_info, f)
     eci_mean_testing_rms = np.mean(np.array(eci_mean_testing_rms), axis=0)
+    eci_mean = None if eci_mean_sum is None else eci_mean_sum / run_count
     return {
         "train_rms": train_rms_values,
         "test_rms": test_rms_values,
@@ -8,6 +8,9 @@ import json
 from typing import List, Tuple
 import shutil
 import warnings
+import hashlib
+from collections import OrderedDict
+from functools import wraps
 
 libpath = pathlib.Path(__file__).parent.resolve()
 
@@ -165,6 +168,45 @@ def column_sort(matrix: np.ndarray, column_index: int) -> np.ndarray:
     return sorted_matrix
 
 
+def _array_digest(array: np.ndarray) -> tuple:
+    """Hashable key for the contents of an array: its dtype, shape and a digest of its data."""
+    array = np.ascontiguousarray(array)
+    return (array.dtype.str, array.shape, hashlib.blake2b(array).digest())
+
+
+def cache_by_array_digest(maxsize: int = 8):
+    """Decorator for a least recently used cache of a function of numpy arrays (and hashable arguments).
+
+    Arrays are keyed on a digest of their contents, so the cache does not hold copies of its inputs.
+    Cached array results are shared between calls, and are made read-only.
+    """
+
+    def decorator(function):
+        cache = OrderedDict()
+
+        @wraps(function)
+        def cached_function(*args):
+            key = tuple(
+                _array_digest(arg) if isinstance(arg, np.ndarray) else arg
+                for arg in args
+            )
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            result = function(*args)
+            for array in result if isinstance(result, tuple) else (result,):
+                array.setflags(write=False)
+            cache[key] = result
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return result
+
+        cached_function.cache_clear = cache.clear
+        return cached_function
+
+    return decorator
+
+
 def find(lst: list, a: float):
     """Finds the index of an element that matches a specified value.
     Args:
@@ -13,11 +13,9 @@ def plot_eci_uncertainty(eci: np.ndarray, title=False) -> plt.figure:
     -------
     fig: matplotlib.pyplot figure
     """
-    stats = np.array([[np.mean(row), np.std(row)] for row in eci])
-    print(stats.shape)
-    means = stats[:, 0]
-    std = stats[:, 1]
-    index = list(range(eci.shape[0]))
+    means = eci.mean(axis=1)
+    std = eci.std(axis=1)
+    index = np.arange(eci.shape[0])
 
     plt.scatter(index, means, color="xkcd:crimson", label="Means")
     plt.errorbar(index, means, std, ls="none", color="k", label="Stddev")
@@ -1,18 +1,156 @@
 import matplotlib.pyplot as plt
 import matplotlib
+import matplotlib.colors as mcolors
 import numpy as np
-from scipy.spatial import ConvexHull
 import thermocore.geometry.hull as thull
-import djlib.djlib as dj
-from sklearn.metrics import mean_squared_error
 import djlib.clex.clex as cl
+import djlib.djlib as dj
+
+# Point clouds larger than this are drawn as a density image by backend="auto".
+_DENSITY_THRESHOLD = 50000
+_DENSITY_BINS = (600, 450)
+
+# Pre-parsed RGBA colours and labels shared by every call of general_binary_convex_hull_plotter
+_TRUE_COLOR = mcolors.to_rgba("black")
+_PRED_COLOR = mcolors.to_rgba("red")
+_SPURIOUS_COLOR = mcolors.to_rgba("royalblue")
+_PRED_LABEL = "Predicted Energies"
+
+# Turns smaller than this, relative to the magnitude of the cross product terms, are treated as collinear
+# (rounding noise), so nearly collinear points are dropped from the lower hull like Qhull does.
+_COLLINEAR_RTOL = 1e-12
+
+
+def lower_hull_2d(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Finds the lower convex hull of a 2D point set with Andrew's monotone chain algorithm.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        Vector of compositions.
+    y: numpy.ndarray
+        Vector of formation energies, same length as x.
+
+    Returns
+    -------
+    numpy.ndarray
+        Indices of the lower hull vertices, sorted by increasing x.
+    """
+    x = np.ravel(x)
+    y = np.ravel(y)
+
+    # Only the lowest point at each distinct x can be a lower hull vertex. This also removes vertical hull edges.
+    order = np.argsort(x)
+    x_sorted = x[order]
+    group_starts = np.flatnonzero(np.r_[True, x_sorted[1:] != x_sorted[:-1]])
+    if group_starts.size < order.size:
+        y_sorted = y[order]
+        group_sizes = np.diff(np.append(group_starts, order.size))
+        group_min = np.minimum.reduceat(y_sorted, group_starts)
+        at_min = np.flatnonzero(y_sorted == np.repeat(group_min, group_sizes))
+        group = np.repeat(np.arange(group_starts.size), group_sizes)[at_min]
+        order = order[at_min[np.r_[True, group[1:] != group[:-1]]]]
+    candidates = order
+    if candidates.size <= 2:
+        return candidates
+
+    # Points above the chords joining the end points to the global minimum can't be on the lower hull either.
+    cx = x[candidates]
+    cy = y[candidates]
+    lowest = np.argmin(cy)
+    below_chords = cy <= np.interp(cx, cx[[0, lowest, -1]], cy[[0, lowest, -1]])
+    below_chords[[0, lowest, -1]] = True
+    candidates = candidates[below_chords]
+    cx = cx[below_chords]
+    cy = cy[below_chords]
+
+    # A point that does not turn counter-clockwise against its current neighbours is not a hull vertex,
+    # so drop all of them at once while that still thins the set out quickly.
+    while cx.size > 2:
+        turn_left = (cx[1:-1] - cx[:-2]) * (cy[2:] - cy[:-2])
+        turn_right = (cy[1:-1] - cy[:-2]) * (cx[2:] - cx[:-2])
+        keep = np.ones(cx.size, dtype=bool)
+        np.greater(
+            turn_left - turn_right,
+            _COLLINEAR_RTOL * (np.abs(turn_left) + np.abs(turn_right)),
+            out=keep[1:-1],
+        )
+        n_dropped = cx.size - np.count_nonzero(keep)
+        candidates = candidates[keep]
+        cx = cx[keep]
+        cy = cy[keep]
+        if n_dropped * 8 < cx.size:
+            break
+
+    cx = cx.tolist()
+    cy = cy.tolist()
+    stack = []
+    for i in range(len(cx)):
+        # Pop the last vertex while it does not make a counter-clockwise turn.
+        while len(stack) >= 2:
+            a = stack[-2]
+            b = stack[-1]
+            turn_left = (cx[b] - cx[a]) * (cy[i] - cy[a])
+            turn_right = (cy[b] - cy[a]) * (cx[i] - cx[a])
+            if turn_left - turn_right <= _COLLINEAR_RTOL * (
+                abs(turn_left) + abs(turn_right)
+            ):
+                stack.pop()
+            else:
+                break
+        stack.append(i)
+    return candidates[stack]
+
+
+# general_binary_convex_hull_plotter is often called repeatedly on the same data.
+_cached_lower_hull_2d = dj.cache_by_array_digest(maxsize=4)(lower_hull_2d)
+
+
+def _plot_point_cloud(
+    ax: matplotlib.axes.Axes,
+    x: np.ndarray,
+    y: np.ndarray,
+    backend: str,
+    cmap: str,
+    **plot_kwargs,
+):
+    """Draws a single-colour point cloud on ax, either as markers or as a 2D histogram image.
+
+    Markers are drawn as one Line2D rather than a per-point PathCollection. With backend="density", or backend="auto" above
+    _DENSITY_THRESHOLD points, the points are binned instead, so drawing cost no longer grows with the number of points.
+    """
+    if backend not in ("auto", "markers", "density"):
+        raise ValueError(
+            'backend must be one of "auto", "markers" or "density", not %s' % backend
+        )
+    if backend == "density" or (backend == "auto" and x.size > _DENSITY_THRESHOLD):
+        counts, x_edges, y_edges = np.histogram2d(x, y, bins=_DENSITY_BINS)
+        image = ax.imshow(
+            np.ma.masked_equal(counts.T, 0),
+            extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]),
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            cmap=cmap,
+            norm=mcolors.LogNorm(),
+        )
+        # Let the axes keep their usual margins instead of snapping to the image extent
+        image.sticky_edges.x.clear()
+        image.sticky_edges.y.clear()
+        # Empty proxy so the legend entry is unchanged
+        ax.plot([], [], linestyle="none", **plot_kwargs)
+    else:
+        # Rasterized so vector outputs (pdf, svg) embed one image instead of a path per point
+        ax.plot(x, y, linestyle="none", rasterized=True, **plot_kwargs)
 
 
 def general_binary_convex_hull_plotter(
     composition: np.ndarray,
     true_energies: np.ndarray,
-    predicted_energies=[None],
+    predicted_energies=None,
     print_extra_info: bool = False,
+    ax: matplotlib.axes.Axes = None,
+    backend: str = "auto",
 ) -> matplotlib.figure.Figure:
     """Plots a 2D convex hull for any 2D dataset. Can optionally include predicted energies to compare true and predicted formation energies and conved hulls.
 
@@ -24,33 +162,60 @@ def general_binary_convex_hull_plotter(
         Vector of formation energies. Required.
     predicted_energies: numpy.ndarray
         None by default. If a vector of energies are provided, it must be the same length as composition. RMSE score will be reported.
+    ax: matplotlib.axes.Axes
+        None by default. Axes to draw on, so that repeated calls can reuse one figure. If None, draws on the current figure and resizes it to 15x12 inches.
+    backend: str
+        "auto" by default. How the energy point clouds are drawn: "markers", "density" (a 2D histogram image, for very large datasets) or "auto", which uses "density" above 50000 points. Hull lines are always drawn as markers.
     """
 
-    predicted_color = "red"
-    predicted_label = "Predicted Energies"
-    plt.scatter(
-        composition, true_energies, color="k", marker="1", label='"True" Energies'
+    # Older callers pass [None] as the "no predictions" sentinel.
+    if predicted_energies is None or (
+        isinstance(predicted_energies, list) and predicted_energies == [None]
+    ):
+        pred = None
+    else:
+        pred = np.asarray(predicted_energies)
+    has_pred = pred is not None
+
+    if ax is None:
+        fig = plt.gcf()
+        fig.set_size_inches(15, 12)
+        ax = fig.gca()
+    fs = {"fontsize": 21}
+
+    # One contiguous (n, 2) buffer per energy set; hull vertices index straight into it.
+    pts_true = np.empty((composition.size, 2), dtype=np.float64)
+    pts_true[:, 0] = np.ravel(composition)
+    pts_true[:, 1] = np.ravel(true_energies)
+    _plot_point_cloud(
+        ax,
+        pts_true[:, 0],
+        pts_true[:, 1],
+        backend,
+        "Greys",
+        color=_TRUE_COLOR,
+        marker="1",
+        label='"True" Energies',
+    )
+    dft_lower_hull_vertices = _cached_lower_hull_2d(
+        pts_true[:, 0], pts_true[:, 1]
     )
-    dft_hull = thull.full_hull(compositions=composition, energies=true_energies)
 
-    if any(predicted_energies):
-        predicted_hull = ConvexHull(
-            np.hstack(
-                (composition.reshape(-1, 1), np.reshape(predicted_energies, (-1, 1)))
-            )
+    if has_pred:
+        pts_pred = np.empty_like(pts_true)
+        pts_pred[:, 0] = pts_true[:, 0]
+        pts_pred[:, 1] = np.ravel(pred)
+        predicted_lower_hull_vertices = _cached_lower_hull_2d(
+            pts_pred[:, 0], pts_pred[:, 1]
         )
-
-    dft_lower_hull_vertices = thull.lower_hull(dft_hull)[0]
-    if any(predicted_energies):
-        predicted_lower_hull_vertices = thull.lower_hull(predicted_hull)[0]
         # Also, check the set difference between the two lower hulls
         spurious = np.setdiff1d(predicted_lower_hull_vertices, dft_lower_hull_vertices)
 
         if len(spurious) > 0:
-            plt.scatter(
+            ax.scatter(
                 composition[spurious],
-                predicted_energies[spurious],
-                color="royalblue",
+                pred[spurious],
+                color=_SPURIOUS_COLOR,
                 marker="s",
                 label="Spurious Predictions",
                 s=400,
@@ -60,60 +225,63 @@ def general_binary_convex_hull_plotter(
                 print("Index", "Composition")
                 for index in spurious:
                     print(index, composition[index])
-    dft_lower_hull = dj.column_sort(dft_hull.points[dft_lower_hull_vertices], 0)
+    dft_lower_hull = pts_true[dft_lower_hull_vertices]
 
-    if any(predicted_energies):
-        predicted_lower_hull = dj.column_sort(
-            predicted_hull.points[predicted_lower_hull_vertices], 0
-        )
+    if has_pred:
+        predicted_lower_hull = pts_pred[predicted_lower_hull_vertices]
 
-    plt.plot(
-        dft_lower_hull[:, 0], dft_lower_hull[:, 1], marker="D", markersize=15, color="k"
+    ax.plot(
+        dft_lower_hull[:, 0],
+        dft_lower_hull[:, 1],
+        marker="D",
+        markersize=15,
+        color=_TRUE_COLOR,
     )
     if print_extra_info:
         print("DFT lower hull vertices:")
         print("Index", "Composition")
         for index in dft_lower_hull_vertices:
             print(index, composition[index])
-    if any(predicted_energies):
-        plt.plot(
+    if has_pred:
+        ax.plot(
             predicted_lower_hull[:, 0],
             predicted_lower_hull[:, 1],
             marker="D",
             markersize=10,
-            color=predicted_color,
+            color=_PRED_COLOR,
         )
         if print_extra_info:
             print("Predicted lower hull vertices:")
             print("Index", "Composition")
             for index in predicted_lower_hull_vertices:
                 print(index, composition[index])
-    if any(predicted_energies):
-        plt.scatter(
-            composition,
-            predicted_energies,
-            color="red",
+    if has_pred:
+        _plot_point_cloud(
+            ax,
+            pts_pred[:, 0],
+            pts_pred[:, 1],
+            backend,
+            "Reds",
+            color=_PRED_COLOR,
             marker="2",
-            label=predicted_label,
+            label=_PRED_LABEL,
         )
 
-        rmse = np.sqrt(mean_squared_error(true_energies, predicted_energies))
-        plt.text(
-            min(composition),
-            0.9 * min(np.concatenate((true_energies, predicted_energies))),
-            "RMSE: " + str(rmse) + " eV",
+        diff = pts_true[:, 1] - pts_pred[:, 1]
+        rmse = np.sqrt(diff.dot(diff) / diff.size)
+        ax.text(
+            pts_true[:, 0].min(),
+            0.9 * min(pts_true[:, 1].min(), pts_pred[:, 1].min()),
+            f"RMSE: {rmse:.4f} eV",
             fontsize=19,
         )
 
-    plt.xlabel("Composition X", fontsize=21)
-    plt.ylabel("Formation Energy per Primitive Cell (eV)", fontsize=21)
-    plt.legend(fontsize=19, loc="upper right")
-    plt.xticks(fontsize=18)
-    plt.yticks(fontsize=18)
+    ax.set_xlabel("Composition X", **fs)
+    ax.set_ylabel("Formation Energy per Primitive Cell (eV)", **fs)
+    ax.legend(fontsize=19, loc="upper right")
+    ax.tick_params(axis="both", labelsize=18)
 
-    fig = plt.gcf()
-    fig.set_size_inches(15, 12)
-    return fig
+    return ax.figure
 
 def binary_convex_hull_plotter_dft_and_overenumeration(ax, dft_comp, dft_formation_energies, dft_corr, over_comp, over_formation_energies, over_corr, dft_names=None, over_names=None, verbose=False):
     '''
@@ -152,8 +320,10 @@ def binary_convex_hull_plotter_dft_and_overenumeration(ax, dft_comp, dft_formati
     over_hull = thull.full_hull(compositions=over_comp, energies=over_formation_energies)
     over_lower_hull_vertices, _over = thull.lower_hull(over_hull)
     print('DFT hull vertices:', dft_lower_hull_vertices, dft_comp[dft_lower_hull_vertices].flatten(), '\nOverenumerated hull vertices:', over_lower_hull_vertices, over_comp[over_lower_hull_vertices].flatten())
-    dft_lower_hull = dj.column_sort(dft_hull.points[dft_lower_hull_vertices], 0)
-    over_lower_hull = dj.column_sort(over_hull.points[over_lower_hull_vertices], 0)
+    dft_lower_hull = dft_hull.points[dft_lower_hull_vertices]
+    dft_lower_hull = dft_lower_hull[np.argsort(dft_lower_hull[:, 0])]
+    over_lower_hull = over_hull.points[over_lower_hull_vertices]
+    over_lower_hull = over_lower_hull[np.argsort(over_lower_hull[:, 0])]
 
     dft_hull_indices_in_overenumerated = []
     over_hull_indices_in_dft = []
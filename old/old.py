@@ -1,30 +1,256 @@
+import json
+import math
+import mmap
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import matplotlib.pyplot as plt
 import numpy as np
 import pickle
 from string import Template
+from warnings import warn
+from joblib import Parallel, delayed
+from scipy.linalg import lu_factor, lu_solve
+from sklearn.linear_model import Lasso, lasso_path
+from sklearn.model_selection import KFold, ShuffleSplit
+from tqdm import tqdm
+import thermocore.geometry.hull as thull
+import djlib.djlib as dj
+from djlib.clex.clex import (
+    format_stan_executable_script,
+    hull_interpolation_matrix,
+    uncalculated_energies_to_nan,
+)
+
+
+# Stan model templates used by format_stan_model, parsed once at import.
+_STAN_FIXED_VARIANCE_MODEL = Template(
+    """data {
+        int K; 
+        int n_configs;
+        matrix[n_configs, K] corr;
+        vector[n_configs] energies;
+    }
+parameters {
+        vector[K] eci;
+    }
+model 
+    {
+        real sigma = $formatted_sigma;
+        for (k in 1:K){
+            eci[k] ~ normal(0,$formatted_eci_variance);
+        }
+        energies ~ normal(corr * eci, sigma);
+    }"""
+)
+_STAN_VARIANCE_PRIOR_MODEL = Template(
+    """data {
+        int K; 
+        int n_configs;
+        matrix[n_configs, K] corr;
+        vector[n_configs] energies;
+    }
+parameters {
+        vector[K] eci;
+        vector<lower=0>[K] eci_variance;
+    }
+model 
+    {
+        real sigma = $formatted_sigma;
+        for (k in 1:K){
+            eci_variance[k] ~ $formatted_eci_variance ;
+            eci[k] ~ normal(0,eci_variance[k]);
+        }
+        energies ~ normal(corr * eci, sigma);
+    }"""
+)
+
+
+def _lasso_fold_mse(
+    corr: np.ndarray,
+    formation_energy: np.ndarray,
+    gram: np.ndarray,
+    corr_energy: np.ndarray,
+    test_index: np.ndarray,
+    alphas: np.ndarray,
+    max_iter: int,
+    selection: str,
+    random_state,
+) -> np.ndarray:
+    """Mean squared testing error of a LASSO path fit to all configurations except test_index. Helper for run_lassocv."""
+    test_corr = corr[test_index]
+    test_energy = formation_energy[test_index]
+    train_mask = np.ones(corr.shape[0], dtype=bool)
+    train_mask[test_index] = False
+
+    # Downdate the full-data Gram matrix instead of rebuilding it from the training rows.
+    _, coefs, _ = lasso_path(
+        corr[train_mask],
+        formation_energy[train_mask],
+        alphas=alphas,
+        precompute=gram - test_corr.T @ test_corr,
+        Xy=corr_energy - test_corr.T @ test_energy,
+        max_iter=max_iter,
+        selection=selection,
+        random_state=random_state,
+    )
+    return np.mean((test_energy.reshape(-1, 1) - test_corr @ coefs) ** 2, axis=0)
 
 
-def generate_rand_eci_vec(num_eci: int, stdev: float, normalization: float):
-    """Generates a random, normalized vector in eci space. Each element is drawn from a standard normal distribution.
+def run_lassocv(
+    corr: np.ndarray,
+    formation_energy: np.ndarray,
+    kfold: int = 5,
+    n_alphas: int = 100,
+    n_jobs: int = -1,
+    max_iter: int = 50000,
+    selection: str = "random",
+    random_state=0,
+) -> np.ndarray:
+    """Fits ECI with k-fold cross validated LASSO regression.
+
+    Parameters
+    ----------
+    corr : numpy.ndarray
+        CASM nxk correlation matrix, n = number of configurations, k = number of ECI.
+    formation_energy : numpy.ndarray
+        Vector of n DFT-calculated formation energies.
+    kfold : int
+        Number of cross validation folds. Default is 5.
+    n_alphas : int
+        Number of regularization strengths along the LASSO path. Default is 100.
+    n_jobs : int
+        Number of folds fit in parallel. Default is -1 (all cores).
+    max_iter : int
+        Maximum coordinate descent iterations for each regularization strength.
+    selection : str
+        Coordinate descent update order, "random" or "cyclic". Random selection usually converges faster on the strongly correlated columns of a correlation matrix. Default is "random".
+    random_state : int
+        Seed for random coordinate selection. Default is 0.
+
+    Returns
+    -------
+    eci : numpy.ndarray
+        Vector of k ECI values at the cross validated regularization strength.
+
+    Notes
+    -----
+    The Gram matrix corr.T @ corr is computed once. Each fold subtracts the contribution of its held out rows, which gives the exact training Gram matrix without leaking testing data.
+    Folds are fit in parallel with one full regularization path per worker, rather than one task per (fold, alpha) pair.
+    """
+    corr = np.asarray(corr, dtype=float)
+    formation_energy = np.asarray(formation_energy, dtype=float)
+    gram = corr.T @ corr
+    corr_energy = corr.T @ formation_energy
+
+    # Same regularization grid as sklearn's LassoCV
+    alpha_max = np.max(np.abs(corr_energy)) / corr.shape[0]
+    alphas = np.logspace(np.log10(alpha_max), np.log10(alpha_max * 1e-3), n_alphas)
+
+    fold_mse = Parallel(n_jobs=n_jobs)(
+        delayed(_lasso_fold_mse)(
+            corr,
+            formation_energy,
+            gram,
+            corr_energy,
+            test_index,
+            alphas,
+            max_iter,
+            selection,
+            random_state,
+        )
+        for _, test_index in KFold(n_splits=kfold).split(corr)
+    )
+    best_alpha = alphas[np.argmin(np.mean(fold_mse, axis=0))]
+
+    lasso = Lasso(
+        alpha=best_alpha,
+        fit_intercept=False,
+        precompute=gram,
+        max_iter=max_iter,
+        selection=selection,
+        random_state=random_state,
+    )
+    lasso.fit(corr, formation_energy)
+    return lasso.coef_
+
+
+def generate_rand_eci_vec(
+    num_eci: int, stdev: float, normalization: float, rng=None
+):
+    """Generates a random, normalized vector in eci space. Each element is drawn from a standard normal distribution,
+    so the direction is uniformly distributed on the sphere.
 
     Parameters
     ----------
     num_eci : int
         The number of ECI.
     stdev : float
-        Standard deviation defining the standard normal distribution for each element.
+        Unused: any scale of the normal distribution cancels when the vector is normalized. Kept for compatibility.
     normalization : float
         Magnitude to scale the random vector by.
+    rng : numpy.random.Generator
+        Random number generator to draw from. By default, uses the global numpy random state.
 
     Returns
     -------
     eci_vec : numpy.ndarray
         Random, scaled vector in ECI space.
     """
-    eci_vec = np.random.normal(scale=stdev, size=num_eci)
-    eci_vec = (eci_vec / np.linalg.norm(eci_vec)) * normalization
+    if rng is None:
+        rng = np.random
+    eci_vec = rng.standard_normal(num_eci)
+    eci_vec *= normalization / math.sqrt(eci_vec @ eci_vec)
     return eci_vec
 
 
+def _log_metropolis_hastings_ratio(
+    current_eci: np.ndarray,
+    proposed_eci: np.ndarray,
+    current_energy: np.ndarray,
+    proposed_energy: np.ndarray,
+    formation_energy: np.ndarray,
+) -> float:
+    """Natural log of the unclamped metropolis_hastings_ratio. Positive when the proposed step is more likely than the current state.
+    Both terms of the ratio are raised to powers of minus the number of ECI or configurations, which overflow
+    or underflow for realistic system sizes; in log space they are plain differences.
+    """
+    proposed_residual = formation_energy - proposed_energy
+    current_residual = formation_energy - current_energy
+    return _log_metropolis_hastings_ratio_from_norms(
+        current_eci.shape[0],
+        formation_energy.shape[0],
+        np.abs(current_eci).sum(),
+        np.abs(proposed_eci).sum(),
+        current_residual @ current_residual,
+        proposed_residual @ proposed_residual,
+    )
+
+
+def _log_metropolis_hastings_ratio_from_norms(
+    number_eci: int,
+    number_configs: int,
+    current_eci_l1: float,
+    proposed_eci_l1: float,
+    current_squared_residual: float,
+    proposed_squared_residual: float,
+    log=math.log,
+) -> float:
+    """_log_metropolis_hastings_ratio from the L1 norms of the ECI and the squared norms of the energy residuals.
+    Lets the Monte Carlo chain keep the norms of the current state between steps instead of recomputing them.
+    log computes the natural logarithm; the GPU chain passes cupy.log so that the norms never leave the device.
+    """
+    log_left_term = -number_eci * (log(proposed_eci_l1) - log(current_eci_l1))
+    log_right_term = (
+        -0.5
+        * number_configs
+        * (log(proposed_squared_residual) - log(current_squared_residual))
+    )
+    return log_left_term + log_right_term
+
+
 def metropolis_hastings_ratio(
     current_eci: np.ndarray,
     proposed_eci: np.ndarray,
@@ -50,23 +276,224 @@ def metropolis_hastings_ratio(
     mh_ratio : float
         Ratio defined in paper listed above- used in deciding whether to accept or reject proposed_eci.
     """
+    log_mh_ratio = _log_metropolis_hastings_ratio(
+        current_eci, proposed_eci, current_energy, proposed_energy, formation_energy
+    )
+    if log_mh_ratio > 0:
+        return 1
+    return math.exp(log_mh_ratio)
+
+
+def _monte_carlo_sample_count(iterations: int, burn_in: int, sample_frequency: int) -> int:
+    """Number of samples recorded by _eci_monte_carlo_chain: the starting point, then every multiple of sample_frequency after burn_in."""
+    first_sample = (burn_in // sample_frequency + 1) * sample_frequency
+    return 1 + len(range(first_sample, iterations, sample_frequency))
+
+
+# Random steps for the ECI Monte Carlo are drawn in blocks of about this many numbers (8 MB of float64).
+_MC_RANDOM_BLOCK_ELEMENTS = 2**20
+
+
+def _eci_monte_carlo_chain(
+    corr: np.ndarray,
+    formation_energy_calculated: np.ndarray,
+    comp: np.ndarray,
+    dft_hull_indices: np.ndarray,
+    dft_hull_comps: np.ndarray,
+    initial_eci: np.ndarray,
+    eci_walk_step_size: float,
+    iterations: int,
+    burn_in: int,
+    sample_frequency: int,
+    tolerance: float,
+    seed=None,
+    use_gpu=False,
+    sample_files=None,
+    chain_index=None,
+    config_order=None,
+):
+    """Runs one Metropolis-Hastings chain in ECI space, starting from initial_eci. Helper for run_eci_monte_carlo.
+    The first formation_energy_calculated.shape[0] rows of corr and comp must be the calculated configurations, in the same order.
+    All per-step records are written into arrays allocated up front.
+    With use_gpu, the correlations, energies, ECI, norms and rms stay on the GPU (requires cupy), and only the accept/reject
+    decision is copied back each step. Random numbers are still drawn on the host, so a seeded chain follows the same steps
+    on either device.
+    With sample_files, a pair of preallocated .npy files for the sampled ECI and hull distances, samples are streamed to
+    the files through memory maps and hull distances are recorded as well. With chain_index, the chain writes to that
+    index of the files' leading (chain) axis, so that parallel chains can share one pair of files. Columns of the sampled
+    hull distances follow config_order (the configuration index of each row of corr), or the rows of corr if it is not given.
+
+    Returns
+    -------
+    sampled_eci : numpy.ndarray shape(number_samples, number_eci)
+        initial_eci, followed by the ECI at every sample step.
+    sampled_hulldist : numpy.ndarray shape(number_samples, number_configurations) or None
+        Distance of every configuration from the predicted DFT hull, recorded alongside sampled_eci. None without sample_files.
+    acceptance : numpy.ndarray shape(iterations,)
+        Whether each proposed step was accepted.
+    rms : numpy.ndarray shape(iterations,)
+        RMSE of the current ECI against formation_energy_calculated after each step.
+    proposed_ground_states_indices : numpy.ndarray
+        Indices (rows of corr) of configurations more than tolerance below the predicted DFT hull, collected at every sample step.
+    """
+    rng = np.random.default_rng(seed)
+    if use_gpu:
+        import cupy as xp
+        from cupyx.scipy.sparse import csr_matrix as device_csr_matrix
+
+        to_host = xp.asnumpy
+        # Scalars stay 0-d device arrays, so that computing them does not wait for the device
+        to_scalar, log, sqrt = xp.asarray, xp.log, xp.sqrt
+    else:
+        xp = np
+        to_host = np.asarray
+        to_scalar, log, sqrt = float, math.log, math.sqrt
+
+    # The calculated block is multiplied every step for the acceptance test; the rest only when a step is accepted.
+    number_calculated = formation_energy_calculated.shape[0]
+    corr_calculated = xp.asarray(corr[:number_calculated])
+    corr_uncalculated = xp.asarray(corr[number_calculated:])
+    formation_energy_calculated = xp.asarray(formation_energy_calculated)
+
+    if sample_files:
+        sampled_eci, sampled_hulldist = [
+            np.load(path, mmap_mode="r+") for path in sample_files
+        ]
+        if chain_index is not None:
+            sampled_eci = sampled_eci[chain_index]
+            sampled_hulldist = sampled_hulldist[chain_index]
+    else:
+        number_samples = _monte_carlo_sample_count(iterations, burn_in, sample_frequency)
+        sampled_eci = np.empty((number_samples, initial_eci.shape[0]))
+        # number_samples x number_configurations is too large to hold in memory for long runs
+        sampled_hulldist = None
+    if config_order is None:
+        config_order = slice(None)
+    acceptance = np.empty(iterations, dtype=bool)
+    rms = xp.empty(iterations)
+    # Per-sample index arrays, concatenated once at the end
+    proposed_ground_states_chunks = []
+
+    # Energies are linear in the ECI: compute them once, then update by the energy change of each accepted step.
+    # Energies of the uncalculated configurations are only needed for the hull check at sample steps.
+    current_eci = xp.asarray(initial_eci)
+    current_energy = xp.matmul(corr_calculated, current_eci)
+    # Norms of the current state only change when a step is accepted
+    current_eci_l1 = to_scalar(xp.abs(current_eci).sum())
+    residual = formation_energy_calculated - current_energy
+    current_squared_residual = to_scalar(residual @ residual)
+    current_rms = sqrt(current_squared_residual / residual.size)
+    sampled_eci[0] = to_host(current_eci)
+    sample_index = 1
+
+    # The DFT hull compositions never change, so triangulate once and reuse the interpolation weights every step.
+    interpolation_matrix = hull_interpolation_matrix(dft_hull_comps, comp)
+    if use_gpu:
+        interpolation_matrix = device_csr_matrix(interpolation_matrix)
+        dft_hull_indices = xp.asarray(dft_hull_indices)
+    if sampled_hulldist is not None:
+        full_predicted_energy = xp.concatenate(
+            (current_energy, xp.matmul(corr_uncalculated, current_eci))
+        )
+        sampled_hulldist[0, config_order] = to_host(
+            full_predicted_energy
+            - interpolation_matrix @ (full_predicted_energy[dft_hull_indices])
+        )
 
-    left_term = np.power(
-        (np.linalg.norm(proposed_eci, ord=1) / np.linalg.norm(current_eci, ord=1)),
-        (-1 * current_eci.shape[0]),
+    # Draw the random steps and acceptance thresholds a block at a time instead of making two small draws per step.
+    steps_per_block = max(
+        1, min(iterations, _MC_RANDOM_BLOCK_ELEMENTS // initial_eci.shape[0])
     )
+    # Refresh the progress bar about a thousand times per run rather than every step
+    for i in tqdm(
+        range(iterations),
+        desc="Monte Carlo Progress",
+        miniters=max(1, iterations // 1000),
+        mininterval=0.5,
+    ):
+        block_index = i % steps_per_block
+        if block_index == 0:
+            random_steps = rng.standard_normal(
+                (min(steps_per_block, iterations - i), initial_eci.shape[0])
+            )
+            random_steps *= (
+                eci_walk_step_size
+                / np.sqrt(np.einsum("ij,ij->i", random_steps, random_steps))
+            )[:, np.newaxis]
+            log_acceptance_comparisons = xp.asarray(
+                np.log(rng.uniform(size=random_steps.shape[0]))
+            )
+            random_steps = xp.asarray(random_steps)
+        eci_random_vec = random_steps[block_index]
+        proposed_eci = current_eci + eci_random_vec
+        proposed_energy = current_energy + xp.matmul(corr_calculated, eci_random_vec)
+
+        proposed_eci_l1 = to_scalar(xp.abs(proposed_eci).sum())
+        residual = formation_energy_calculated - proposed_energy
+        proposed_squared_residual = to_scalar(residual @ residual)
+
+        # Accepting when log(ratio) >= log(u) is the same test as min(1, ratio) >= u, without exponentiating.
+        log_mh_ratio = _log_metropolis_hastings_ratio_from_norms(
+            proposed_eci.shape[0],
+            residual.shape[0],
+            current_eci_l1,
+            proposed_eci_l1,
+            current_squared_residual,
+            proposed_squared_residual,
+            log,
+        )
 
-    right_term_numerator = np.linalg.norm(formation_energy - proposed_energy)
-    right_term_denom = np.linalg.norm(formation_energy - current_energy)
+        # The only value copied from the device each step
+        acceptance[i] = bool(log_mh_ratio >= log_acceptance_comparisons[block_index])
+        if acceptance[i]:
+            current_eci = proposed_eci
+            current_energy = proposed_energy
+            current_eci_l1 = proposed_eci_l1
+            current_squared_residual = proposed_squared_residual
+            current_rms = sqrt(current_squared_residual / residual.size)
+        rms[i] = current_rms
 
-    right_term = np.power(
-        (right_term_numerator / right_term_denom), (-1 * formation_energy.shape[0])
+        # Only record a subset of all monte carlo steps to avoid excessive correlation
+        if (i > burn_in) and (i % sample_frequency == 0):
+            # Compare to DFT hull (checkhull with the precomputed interpolation matrix, written out so it also runs on the GPU).
+            # Hull energies are read from the full prediction, so hull configurations sit exactly on the hull.
+            full_predicted_energy = xp.concatenate(
+                (current_energy, xp.matmul(corr_uncalculated, current_eci))
+            )
+            hulldist = full_predicted_energy - interpolation_matrix @ (
+                full_predicted_energy[dft_hull_indices]
+            )
+            below_hull_indices = xp.flatnonzero(hulldist < -tolerance)
+
+            sampled_eci[sample_index] = to_host(current_eci)
+            if sampled_hulldist is not None:
+                sampled_hulldist[sample_index, config_order] = to_host(hulldist)
+            sample_index += 1
+            proposed_ground_states_chunks.append(to_host(below_hull_indices))
+
+    proposed_ground_states_indices = np.concatenate(
+        [np.empty(0, dtype=np.intp)] + proposed_ground_states_chunks
     )
+    if sample_files:
+        sampled_eci.flush()
+        sampled_hulldist.flush()
+    return (
+        sampled_eci,
+        sampled_hulldist,
+        acceptance,
+        to_host(rms),
+        proposed_ground_states_indices,
+    )
+
 
-    mh_ratio = left_term * right_term
-    if mh_ratio > 1:
-        mh_ratio = 1
-    return mh_ratio
+def _eci_monte_carlo_chain_records(*args, **kwargs):
+    """Runs _eci_monte_carlo_chain, returning the sampled arrays only when they are not written to files.
+    Keeps parallel workers from sending memory mapped samples back to the parent process by value.
+    """
+    sampled_eci, sampled_hulldist, *records = _eci_monte_carlo_chain(*args, **kwargs)
+    if kwargs.get("sample_files"):
+        sampled_eci = sampled_hulldist = None
+    return (sampled_eci, sampled_hulldist, *records)
 
 
 def run_eci_monte_carlo(
@@ -76,6 +503,11 @@ def run_eci_monte_carlo(
     sample_frequency: int,
     burn_in=1000000,
     output_file_path=False,
+    seed=None,
+    tolerance=1e-5,
+    use_gpu=False,
+    num_chains=1,
+    n_jobs=-1,
 ):
     """Samples ECI space according to Metropolis Monte Carlo, recording ECI values and most likely ground state configurations.
 
@@ -91,8 +523,21 @@ def run_eci_monte_carlo(
         The number of steps that pass before ECI and proposed ground states are recorded.
     burn_in : int
         The number of steps to "throw away" before ECI and proposed ground states are recorded.
-    output_dir : str
-        Path to the directory where monte carlo results should be written. By default, results are not written to a file.
+    output_file_path : str
+        Path to the file where monte carlo results should be pickled. By default, results are not written to a file.
+        When given, sampled ECI and hull distances are streamed to memory mapped "<output_file_path>.sampled_eci.npy"
+        and "<output_file_path>.sampled_hulldist.npy" files, shared by all chains, and the pickle holds their file names
+        in place of the arrays. The returned arrays are read-only memory maps of these files.
+    seed : int
+        Seed for the random number generator, so that a run can be reproduced. By default, a fresh seed is drawn.
+    tolerance : float
+        A configuration is only flagged as a proposed ground state if it is more than tolerance (eV) below the hull, so that rounding noise does not flag the hull configurations themselves. Default is 1e-5.
+    use_gpu : bool
+        Experimental. If True, run the Monte Carlo chain on the GPU with cupy (must be installed). Worthwhile for large correlation matrices. Default is False.
+    num_chains : int
+        Number of independent chains, each starting from the LASSO ECI with its own random stream spawned from seed. Default is 1.
+    n_jobs : int
+        Number of chains run in parallel when num_chains > 1. Default is -1 (all cores).
 
     Returns
     -------
@@ -106,6 +551,10 @@ def run_eci_monte_carlo(
             Number of iterations to "throw away" before recording samples.
         "sampled_eci": numpy.ndarray shape(number_samples, number_eci)
             Each row contains the eci values of a given iteration.
+            When num_chains > 1, sampled_eci, sampled_hulldist, acceptance and rms gain a leading axis of length num_chains,
+            and the proposed ground state indices of all chains are concatenated.
+        "sampled_hulldist": numpy.ndarray shape(number_samples, number_configurations) or None
+            Hull distance of every configuration at each sample, in the order of the casm query data file. Only recorded with output_file_path.
         "acceptance": numpy.ndarray
             Vector of booleans signifying whether a proposed step in ECI space was accepted or rejected.
         "acceptance_prob": float
@@ -133,99 +582,106 @@ def run_eci_monte_carlo(
             List of configuraton names used in the Monte Carlo calculations.
     """
     # Read data from casm query json output
-    data = vu.casm_query_reader(corr_comp_energy_file)
-    corr = data["corr"]
-    formation_energy = data["formation_energy"]
-    comp = data["comp"]
+    data = dj.casm_query_reader(corr_comp_energy_file)
+    corr = np.array(data["corr"])
+    comp = np.array(data["comp"])
 
     # Dealing with compatibility: Different descriptors for un-calculated formation energy (1.1.2->{}, 1.2-> null (i.e. None))
-    uncalculated_energy_descriptor = None
-    if {} in formation_energy:
-        uncalculated_energy_descriptor = {}
+    formation_energy = uncalculated_energies_to_nan(data["formation_energy"])
 
-    # downsampling only the calculated configs:
-    downsample_selection = formation_energy != uncalculated_energy_descriptor
-    corr_calculated = corr[downsample_selection]
+    # downsampling only the calculated configs. They are stacked ahead of the uncalculated configs,
+    # so the Monte Carlo chain can use them as the leading block of one correlation matrix.
+    downsample_selection = ~np.isnan(formation_energy)
+    stack_order = np.concatenate(
+        (np.flatnonzero(downsample_selection), np.flatnonzero(~downsample_selection))
+    )
+    corr_stacked = corr[stack_order]
+    comp_stacked = comp[stack_order]
     formation_energy_calculated = formation_energy[downsample_selection]
-    comp_calculated = comp[downsample_selection]
+    corr_calculated = corr_stacked[: formation_energy_calculated.shape[0]]
+    comp_calculated = comp_stacked[: formation_energy_calculated.shape[0]]
 
     # Find and store the DFT hull:
-    points = np.zeros(
-        (formation_energy_calculated.shape[0], comp_calculated.shape[1] + 1)
+    hull = thull.full_hull(
+        compositions=comp_calculated, energies=formation_energy_calculated
     )
-    points[:, 0:-1] = comp_calculated
-    points[:, -1] = formation_energy_calculated
-    hull = ConvexHull(points)
-    dft_hull_simplices, dft_hull_config_indices = lower_hull(hull, energy_index=-2)
-    dft_hull_corr = corr_calculated[dft_hull_config_indices]
-    dft_hull_vertices = hull.points[dft_hull_config_indices]
+    dft_hull_config_indices, _ = thull.lower_hull(hull)
+    dft_hull_comps = comp_calculated[dft_hull_config_indices]
 
     # Run lassoCV to get expected eci values
     lasso_eci = run_lassocv(corr_calculated, formation_energy_calculated)
 
-    # Instantiate lists
-    acceptance = []
-    rms = []
-    sampled_eci = []
-    proposed_ground_states_indices = np.array([])
-    sampled_hulldist = []
-
     # Perform MH Monte Carlo
-    current_eci = lasso_eci
-    sampled_eci.append(current_eci)
-    for i in tqdm(range(iterations), desc="Monte Carlo Progress"):
-        eci_random_vec = generate_rand_eci_vec(
-            num_eci=lasso_eci.shape[0], stdev=1, normalization=eci_walk_step_size
-        )
-        proposed_eci = current_eci + eci_random_vec
-
-        current_energy = np.matmul(corr_calculated, current_eci)
-        proposed_energy = np.matmul(corr_calculated, proposed_eci)
-
-        mh_ratio = metropolis_hastings_ratio(
-            current_eci,
-            proposed_eci,
-            current_energy,
-            proposed_energy,
-            formation_energy_calculated,
-        )
-
-        acceptance_comparison = np.random.uniform()
-        if mh_ratio >= acceptance_comparison:
-            acceptance.append(True)
-            current_eci = proposed_eci
-            energy_for_error = proposed_energy
-        else:
-            acceptance.append(False)
-            energy_for_error = current_energy
-
-        # Calculate and append rms:
-        mse = mean_squared_error(formation_energy_calculated, energy_for_error)
-        rms.append(np.sqrt(mse))
-
-        # Compare to DFT hull
-        full_predicted_energy = np.matmul(corr, current_eci)
-        dft_hull_clex_predict_energies = np.matmul(dft_hull_corr, current_eci)
-        hulldist = checkhull(
-            dft_hull_vertices[:, 0:-1],
-            dft_hull_clex_predict_energies,
-            comp,
-            full_predicted_energy,
+    chain_args = (
+        corr_stacked,
+        formation_energy_calculated,
+        comp_stacked,
+        dft_hull_config_indices,
+        dft_hull_comps,
+        lasso_eci,
+        eci_walk_step_size,
+        iterations,
+        burn_in,
+        sample_frequency,
+        tolerance,
+    )
+    sample_files = None
+    if output_file_path:
+        # One pair of files for all chains (leading chain axis for multiple chains), filled in place by each chain.
+        sample_files = (
+            output_file_path + ".sampled_eci.npy",
+            output_file_path + ".sampled_hulldist.npy",
         )
-        sampled_hulldist.append(hulldist)
-        below_hull_selection = hulldist < 0
-        below_hull_indices = np.ravel(np.array(below_hull_selection.nonzero()))
-
-        # Only record a subset of all monte carlo steps to avoid excessive correlation
-        if (i > burn_in) and (i % sample_frequency == 0):
-            sampled_eci.append(current_eci)
-            proposed_ground_states_indices = np.concatenate(
-                (proposed_ground_states_indices, below_hull_indices)
+        chain_shape = (num_chains,) if num_chains > 1 else ()
+        number_samples = _monte_carlo_sample_count(iterations, burn_in, sample_frequency)
+        for path, sample_shape in zip(
+            sample_files,
+            [(number_samples, lasso_eci.shape[0]), (number_samples, corr_stacked.shape[0])],
+        ):
+            np.lib.format.open_memmap(
+                path, mode="w+", shape=chain_shape + sample_shape
+            ).flush()
+
+    if num_chains == 1:
+        chains = [
+            _eci_monte_carlo_chain_records(
+                *chain_args,
+                seed=seed,
+                use_gpu=use_gpu,
+                sample_files=sample_files,
+                config_order=stack_order,
+            )
+        ]
+    else:
+        # Chains are independent: give each its own random stream and run them in parallel.
+        chain_seeds = np.random.SeedSequence(seed).spawn(num_chains)
+        chains = Parallel(n_jobs=n_jobs)(
+            delayed(_eci_monte_carlo_chain_records)(
+                *chain_args,
+                seed=chain_seed,
+                use_gpu=use_gpu,
+                sample_files=sample_files,
+                chain_index=chain_index,
+                config_order=stack_order,
             )
+            for chain_index, chain_seed in enumerate(chain_seeds)
+        )
 
-    acceptance = np.array(acceptance)
-    sampled_eci = np.array(sampled_eci)
-    acceptance_prob = np.count_nonzero(acceptance) / acceptance.shape[0]
+    if num_chains == 1:
+        _, _, acceptance, rms, proposed_ground_states_indices = chains[0]
+    else:
+        acceptance, rms = (np.stack([chain[j] for chain in chains]) for j in (2, 3))
+        proposed_ground_states_indices = np.concatenate([chain[4] for chain in chains])
+    if sample_files:
+        sampled_eci, sampled_hulldist = [
+            np.load(path, mmap_mode="r") for path in sample_files
+        ]
+    elif num_chains == 1:
+        sampled_eci, sampled_hulldist = chains[0][0], None
+    else:
+        sampled_eci, sampled_hulldist = np.stack([chain[0] for chain in chains]), None
+    proposed_ground_states_indices = stack_order[proposed_ground_states_indices]
+    acceptance_prob = np.count_nonzero(acceptance) / acceptance.size
 
     results = {
         "iterations": iterations,
@@ -236,124 +692,21 @@ def run_eci_monte_carlo(
         "acceptance_prob": acceptance_prob,
         "proposed_ground_states_indices": proposed_ground_states_indices,
         "rms": rms,
-        "names": data["names"],
+        "names": data["name"],
         "lasso_eci": lasso_eci,
-        # "sampled_hulldist": sampled_hulldist,
+        "sampled_hulldist": sampled_hulldist,
     }
     if output_file_path:
         print("Saving results to %s" % output_file_path)
+        # The samples are already on disk: pickle their file names rather than the arrays.
+        saved_results = dict(results)
+        saved_results["sampled_eci"], saved_results["sampled_hulldist"] = sample_files
         with open(output_file_path, "wb") as f:
-            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(saved_results, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     return results
 
 
-def format_stan_model(
-    eci_variance_args,
-    likelihood_variance_args,
-    eci_prior="normal",
-    eci_variance_prior="gamma",
-    likelihood_variance_prior="gamma",
-    fixed_variance=False,
-) -> str:
-    """
-    Parameters
-    ----------
-    eci_variance_args: tuple
-        if fixed_variance is True, this should be a single float for eci variance. eg. eci_variance_args = 0.0016
-        if fixed_variance is False, give arguments for the distribution as a tuple. eg. eci_variance_args = (1,1)
-    likelihood_variance_args: tuple
-        if fixed_variance is True, this should be a single float for the model variance. eg. likelihood_variance_args = 0.005
-        if fixed_variance is False, give arguments for the distribution as a tuple. eg. eci_variance_args = (1,1)
-    eci_prior: string
-        Distribution type for ECI priors
-    eci_variance_prior: string
-        Distribution type for ECI variance prior
-    likelihood_variance_prior: string
-        Distribution type for model variance prior
-    fixed_variance: Bool
-        If True, model and ECI variance are fixed values. If false, they follow a distribution governed by hyperparameters.
-        This choice will affect the eci and likelihood variance arg inputs; please read documentation for both.
-
-    Returns
-    -------
-    model_template : str
-        Formatted stan model template
-    """
-
-    # Old args:
-    # TODO: Add filter on string arguments
-
-    supported_eci_priors = ["normal"]
-    supported_eci_variance_priors = ["gamma"]
-    supported_model_variance_priors = ["gamma"]
-
-    assert eci_prior in supported_eci_priors, "Specified ECI prior is not suported."
-    assert (
-        eci_variance_prior in supported_eci_variance_priors
-    ), "Specified ECI variance prior is not supported."
-
-    assert (
-        likelihood_variance_prior in supported_model_variance_priors
-    ), "Specified model variance prior is not supported."
-    # TODO: make this a single string that can be modified to allow any combination of fixed / non-fixed ECI and model variance priors.
-
-    if fixed_variance:
-        # If model and ECI variance are fixed to scalar values
-        formatted_sigma = str(likelihood_variance_args)
-        formatted_eci_variance = str(eci_variance_args)
-
-        ce_model = Template(
-            """data {
-        int K; 
-        int n_configs;
-        matrix[n_configs, K] corr;
-        vector[n_configs] energies;
-    }
-parameters {
-        vector[K] eci;
-    }
-model 
-    {
-        real sigma = $formatted_sigma;
-        for (k in 1:K){
-            eci[k] ~ normal(0,$formatted_eci_variance);
-        }
-        energies ~ normal(corr * eci, sigma);
-    }"""
-        )
-    else:
-        # If model and ECI variance are not fixed (follows a distribution)
-        formatted_sigma = str(likelihood_variance_args)
-        formatted_eci_variance = eci_variance_prior + str(eci_variance_args)
-        ce_model = Template(
-            """data {
-        int K; 
-        int n_configs;
-        matrix[n_configs, K] corr;
-        vector[n_configs] energies;
-    }
-parameters {
-        vector[K] eci;
-        vector<lower=0>[K] eci_variance;
-    }
-model 
-    {
-        real sigma = $formatted_sigma;
-        for (k in 1:K){
-            eci_variance[k] ~ $formatted_eci_variance ;
-            eci[k] ~ normal(0,eci_variance[k]);
-        }
-        energies ~ normal(corr * eci, sigma);
-    }"""
-        )
-    model_template = ce_model.substitute(
-        formatted_sigma=formatted_sigma, formatted_eci_variance=formatted_eci_variance,
-    )
-    # model_template = ce_model.substitute(formatted_eci_variance=formatted_eci_variance)
-    return model_template
-
-
 def cross_validate_stan_model(
     data_file: str,
     num_samples: int,
@@ -414,87 +767,155 @@ def cross_validate_stan_model(
     with open(data_file) as f:
         data = np.array(json.load(f))
 
+    # Group correlations and energies into arrays once; each fold is then a pair of row slices.
+    query_data = dj.casm_query_reader(casm_query_json_data=data)
+    corr = np.squeeze(np.array(query_data["corr"]))
+    energies = uncalculated_energies_to_nan(query_data[energy_tag])
+
     # setup kfold batches, format for stan input
     data_length = data.shape[0]
     ss = ShuffleSplit(n_splits=kfold, random_state=random_seed)
     indices = range(data_length)
 
-    count = 0
-    for train_index, test_index in ss.split(indices):
-
-        # make run directory for this iteration of the kfold cross validation
-        this_run_path = os.path.join(cross_val_directory, "crossval_" + str(count))
-        os.makedirs(this_run_path, exist_ok=True)
-
-        # slice data; write training and testing data in separate files.
-        training_data = data[train_index].tolist()
-        testing_data = data[test_index].tolist()
-        training_data_path = os.path.join(this_run_path, "training_data.json")
-        with open(training_data_path, "w") as f:
-            json.dump(training_data, f)
-        with open(os.path.join(this_run_path, "testing_data.json"), "w") as f:
-            json.dump(testing_data, f)
-
-        # Also write training/ testing indices for easier post processing.
-        run_info = {
-            "training_set": train_index.tolist(),
-            "test_set": test_index.tolist(),
-            "eci_variance_args": eci_variance_args,
-            "likelihood_variance_args": likelihood_variance_args,
-            "data_source": data_file,
-            "random_seed": random_seed,
-        }
-        with open(os.path.join(this_run_path, "run_info.json"), "w") as f:
-            json.dump(run_info, f)
-
-        # Write model info
-
-        # format and write stan model
-        formatted_stan_model = format_stan_model(
-            eci_variance_args=eci_variance_args,
-            eci_prior=eci_prior,
-            eci_variance_prior=eci_variance_prior,
-            likelihood_variance_args=likelihood_variance_args,
-            fixed_variance=fixed_variance,
-        )
-        with open(os.path.join(this_run_path, stan_model_file), "w") as f:
-            f.write(formatted_stan_model)
-
-        # format and write stan executable python script
-        formatted_stan_script = format_stan_executable_script(
-            data_file=training_data_path,
-            stan_model_file=stan_model_file,
-            eci_output_file=eci_output_file,
-            num_samples=num_samples,
-            energy_tag=energy_tag,
-            num_chains=4,
-        )
+    # The stan model is the same for every fold: format it once.
+    formatted_stan_model = format_stan_model(
+        eci_variance_args=eci_variance_args,
+        eci_prior=eci_prior,
+        eci_variance_prior=eci_variance_prior,
+        likelihood_variance_args=likelihood_variance_args,
+        fixed_variance=fixed_variance,
+        warn_deprecated=False,
+    )
 
-        with open(os.path.join(this_run_path, "run_stan.py"), "w") as f:
-            f.write(formatted_stan_script)
-
-        # format and write slurm submission file
-        user_command = "python run_stan.py"
-
-        likelihood_variance_name = str(likelihood_variance_args)
-        if type(eci_variance_args) == type(tuple([1])):
-            eci_name = eci_variance_args[1]
-        else:
-            eci_name = str(eci_variance_args)
-        dj.format_slurm_job(
-            jobname="eci_var_"
-            + str(eci_name)
-            + "likelihood_"
-            + likelihood_variance_name
-            + "_crossval_"
-            + str(count),
-            hours=20,
-            user_command=user_command,
-            output_dir=this_run_path,
+    likelihood_variance_name = str(likelihood_variance_args)
+    if type(eci_variance_args) == type(tuple([1])):
+        eci_name = eci_variance_args[1]
+    else:
+        eci_name = str(eci_variance_args)
+    jobname_prefix = (
+        "eci_var_" + str(eci_name) + "likelihood_" + likelihood_variance_name
+    )
+    run_info = {
+        "eci_variance_args": eci_variance_args,
+        "likelihood_variance_args": likelihood_variance_args,
+        "data_source": data_file,
+        "random_seed": random_seed,
+    }
+
+    train_indices, test_indices = zip(*ss.split(indices))
+    # Folds are independent: write the grouped data once to a scratch directory, then let
+    # worker processes memory-map it and prepare the fold directories in parallel.
+    with tempfile.TemporaryDirectory() as scratch_directory, ProcessPoolExecutor(
+        max_workers=kfold
+    ) as executor:
+        corr_path = os.path.join(scratch_directory, "kfold_corr.npy")
+        energies_path = os.path.join(scratch_directory, "kfold_energies.npy")
+        np.save(corr_path, corr)
+        np.save(energies_path, energies)
+        run_paths = list(
+            executor.map(
+                _prepare_fold,
+                range(kfold),
+                train_indices,
+                test_indices,
+                repeat(corr_path),
+                repeat(energies_path),
+                repeat(cross_val_directory),
+                repeat(run_info),
+                repeat(formatted_stan_model),
+                repeat(stan_model_file),
+                repeat(eci_output_file),
+                repeat(num_samples),
+                repeat(energy_tag),
+                repeat(jobname_prefix),
+            )
         )
-        if submit_with_slurm:
+
+    # Submit serially so sbatch calls are not issued concurrently.
+    if submit_with_slurm:
+        for this_run_path in run_paths:
             dj.submit_slurm_job(this_run_path)
-        count += 1
+
+
+def _prepare_fold(
+    count,
+    train_index,
+    test_index,
+    corr_path,
+    energies_path,
+    cross_val_directory,
+    run_info,
+    formatted_stan_model,
+    stan_model_file,
+    eci_output_file,
+    num_samples,
+    energy_tag,
+    jobname_prefix,
+):
+    """Writes the data, stan model, run script and slurm job for one cross validation fold.
+
+    Returns
+    -------
+    this_run_path : str
+        Path to the run directory of this fold.
+    """
+    corr = np.load(corr_path, mmap_mode="r")
+    energies = np.load(energies_path, mmap_mode="r")
+
+    # make run directory for this iteration of the kfold cross validation
+    this_run_path = os.path.join(cross_val_directory, "crossval_" + str(count))
+    os.makedirs(this_run_path, exist_ok=True)
+
+    # slice data; write training and testing data in separate binary files.
+    training_data_path = os.path.join(this_run_path, "training_data.npz")
+    np.savez(
+        training_data_path,
+        **{
+            "corr": np.take(corr, train_index, axis=0),
+            energy_tag: np.take(energies, train_index),
+        }
+    )
+    np.savez(
+        os.path.join(this_run_path, "testing_data.npz"),
+        **{
+            "corr": np.take(corr, test_index, axis=0),
+            energy_tag: np.take(energies, test_index),
+        }
+    )
+
+    # Also write training/ testing indices for easier post processing.
+    run_info = {
+        "training_set": train_index.tolist(),
+        "test_set": test_index.tolist(),
+        **run_info,
+    }
+    with open(os.path.join(this_run_path, "run_info.json"), "w") as f:
+        json.dump(run_info, f)
+
+    # write stan model
+    with open(os.path.join(this_run_path, stan_model_file), "w") as f:
+        f.write(formatted_stan_model)
+
+    # format and write stan executable python script
+    formatted_stan_script = format_stan_executable_script(
+        data_file=training_data_path,
+        stan_model_file=stan_model_file,
+        eci_output_file=eci_output_file,
+        num_samples=num_samples,
+        energy_tag=energy_tag,
+        num_chains=4,
+    )
+    with open(os.path.join(this_run_path, "run_stan.py"), "w") as f:
+        f.write(formatted_stan_script)
+
+    # format and write slurm submission file
+    dj.format_slurm_job(
+        jobname=jobname_prefix + "_crossval_" + str(count),
+        hours=20,
+        user_command="python run_stan.py",
+        output_dir=this_run_path,
+    )
+    return this_run_path
 
 
 def format_stan_model(
@@ -504,6 +925,7 @@ def format_stan_model(
     eci_variance_prior="gamma",
     likelihood_variance_prior="gamma",
     fixed_variance=False,
+    warn_deprecated=True,
 ) -> str:
     """
     Parameters
@@ -523,16 +945,20 @@ def format_stan_model(
     fixed_variance: Bool
         If True, model and ECI variance are fixed values. If false, they follow a distribution governed by hyperparameters.
         This choice will affect the eci and likelihood variance arg inputs; please read documentation for both.
+    warn_deprecated: Bool
+        If True, warn that this function is deprecated. Internal callers pass False.
 
     Returns
     -------
     model_template : str
         Formatted stan model template
     """
-    warn(
-        'This functinon "format_stan_model() is deprecated. Use "stan_model_formatter()" instead.',
-        DeprecationWarning,
-    )
+    if warn_deprecated:
+        warn(
+            'This function "format_stan_model()" is deprecated. Use "stan_model_formatter()" instead.',
+            DeprecationWarning,
+            stacklevel=2,
+        )
 
     # Old args:
     # TODO: Add filter on string arguments
@@ -551,60 +977,56 @@ def format_stan_model(
     ), "Specified model variance prior is not supported."
     # TODO: make this a single string that can be modified to allow any combination of fixed / non-fixed ECI and model variance priors.
 
-    if fixed_variance:
-        # If model and ECI variance are fixed to scalar values
-        formatted_sigma = str(likelihood_variance_args)
-        formatted_eci_variance = str(eci_variance_args)
-
-        ce_model = Template(
-            """data {
-        int K; 
-        int n_configs;
-        matrix[n_configs, K] corr;
-        vector[n_configs] energies;
-    }
-parameters {
-        vector[K] eci;
-    }
-model 
-    {
-        real sigma = $formatted_sigma;
-        for (k in 1:K){
-            eci[k] ~ normal(0,$formatted_eci_variance);
-        }
-        energies ~ normal(corr * eci, sigma);
-    }"""
-        )
-    else:
-        # If model and ECI variance are not fixed (follows a distribution)
-        formatted_sigma = str(likelihood_variance_args)
-        formatted_eci_variance = eci_variance_prior + str(eci_variance_args)
-        ce_model = Template(
-            """data {
-        int K; 
-        int n_configs;
-        matrix[n_configs, K] corr;
-        vector[n_configs] energies;
-    }
-parameters {
-        vector[K] eci;
-        vector<lower=0>[K] eci_variance;
-    }
-model 
-    {
-        real sigma = $formatted_sigma;
-        for (k in 1:K){
-            eci_variance[k] ~ $formatted_eci_variance ;
-            eci[k] ~ normal(0,eci_variance[k]);
-        }
-        energies ~ normal(corr * eci, sigma);
-    }"""
-        )
-    model_template = ce_model.substitute(
-        formatted_sigma=formatted_sigma, formatted_eci_variance=formatted_eci_variance,
+    # Fixed variance: model and ECI variance are scalar values.
+    # Otherwise the ECI variance follows a distribution governed by hyperparameters.
+    formatted_eci_variance = str(eci_variance_args)
+    if not fixed_variance:
+        formatted_eci_variance = eci_variance_prior + formatted_eci_variance
+    ce_model = (
+        _STAN_FIXED_VARIANCE_MODEL if fixed_variance else _STAN_VARIANCE_PRIOR_MODEL
+    )
+    return ce_model.substitute(
+        formatted_sigma=str(likelihood_variance_args),
+        formatted_eci_variance=formatted_eci_variance,
     )
-    # model_template = ce_model.substitute(formatted_eci_variance=formatted_eci_variance)
-    return model_template
+
+
+def _read_hull_data_file(path: str, columns=range(1, 10)):
+    """Reads a whitespace delimited casm data file with a one line header in a single pass.
+
+    Returns the configuration names (first column) and a float matrix of the requested columns.
+    The numeric columns are parsed by np.loadtxt's C parser from the lines already in memory.
+    """
+    with open(path, "r") as f:
+        lines = [line for line in f.read().splitlines()[1:] if line.strip()]
+    names = [line.split(None, 1)[0] for line in lines]
+    columns = list(columns)
+    if not lines:
+        return names, np.empty((0, len(columns)))
+    data = np.loadtxt(lines, usecols=columns, dtype=np.float64, ndmin=2)
+    return names, data
+
+
+# Line holding the CV, RMS and WRMS scores: two lines below the individual 0 header.
+_CHECK_FILE_SCORES = re.compile(
+    rb"^[ \t]*-- Check: individual 0  --[ \t]*\r?\n(?:.*\n){2}(.*)$", re.MULTILINE
+)
+
+
+def _read_check_file(path: str):
+    """Reads the CV, RMS and WRMS scores of individual 0 from a casm-learn --checkhull output file.
+
+    The file is memory mapped and searched with a single regular expression, rather than iterated line by line.
+    """
+    with open(path, "rb") as checkfile:
+        if os.fstat(checkfile.fileno()).st_size == 0:
+            return None, None, None
+        with mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            match = _CHECK_FILE_SCORES.search(mapped)
+            if match is None:
+                return None, None, None
+            scores = match.group(1).split()
+    return float(scores[3]), float(scores[4]), float(scores[5])
 
 
 def plot_clex_hull_data_1_x(
@@ -620,7 +1042,7 @@ def plot_clex_hull_data_1_x(
     Args:
         fit_dir (str): absolute path to a casm cluster expansion fit.
         hall_of_fame_index (int or str): Integer index. "hall of fame" index for a specific fit (corresponding to a set of "Effective Cluster Interactions" or ECI).
-        full_formation_energy_file (str): filename that contains the formation energy of all configurations of interest. Generated using a casm command
+        full_formation_energy_file (str): filename that contains the formation energy of all configurations of interest. Generated using a casm command. Relative paths are taken relative to fit_dir.
 
     Returns:
         fig: a python figure object.
@@ -642,63 +1064,27 @@ def plot_clex_hull_data_1_x(
     below_hull_exists = False
     hall_of_fame_index = str(hall_of_fame_index)
 
-    # Read necessary files
-    os.chdir(fit_dir)
-    files = glob("*")
-    for f in files:
-        if "_%s_dft_gs" % hall_of_fame_index in f:
-            dft_hull_path = os.path.join(fit_dir, f)
-            dft_hull_data = np.genfromtxt(
-                dft_hull_path, skip_header=1, usecols=list(range(1, 10))
-            ).astype(float)
-            with open(dft_hull_path, "r") as dft_dat_file:
-                dft_scel_names = [
-                    row[0] for row in csv.reader(dft_dat_file, delimiter=" ")
-                ]
-                dft_scel_names = dft_scel_names[1:]
-
-        if "_%s_clex_gs" % hall_of_fame_index in f:
-            clex_hull_path = os.path.join(fit_dir, f)
-            clex_hull_data = np.genfromtxt(
-                clex_hull_path, skip_header=1, usecols=list(range(1, 10))
-            ).astype(float)
-            with open(clex_hull_path, "r") as clex_dat_file:
-                clex_scel_names = [
-                    row[0] for row in csv.reader(clex_dat_file, delimiter=" ")
-                ]
-                clex_scel_names = clex_scel_names[1:]
-
-        if "_%s_below_hull" % hall_of_fame_index in f:
+    # Read necessary files. Each file name is matched once against a single pattern that
+    # names the data it holds; the working directory is left unchanged.
+    hof = re.escape(hall_of_fame_index)
+    file_kind_pattern = re.compile(
+        rf"_{hof}_(?P<kind>dft_gs|clex_gs|below_hull)|^(?P<check>check)\.{hof}(?!\d)"
+    )
+    for f in os.listdir(fit_dir):
+        match = file_kind_pattern.search(f)
+        if match is None:
+            continue
+        kind = match.group("kind") or match.group("check")
+        path = os.path.join(fit_dir, f)
+        if kind == "dft_gs":
+            dft_scel_names, dft_hull_data = _read_hull_data_file(path)
+        elif kind == "clex_gs":
+            clex_scel_names, clex_hull_data = _read_hull_data_file(path)
+        elif kind == "below_hull":
             below_hull_exists = True
-            below_hull_path = os.path.join(fit_dir, f)
-            below_hull_data = np.reshape(
-                np.genfromtxt(
-                    below_hull_path, skip_header=1, usecols=list(range(1, 10))
-                ).astype(float),
-                ((-1, 9)),
-            )
-            with open(below_hull_path, "r") as below_hull_file:
-                below_hull_scel_names = [
-                    row[0] for row in csv.reader(below_hull_file, delimiter=" ")
-                ]
-                below_hull_scel_names = below_hull_scel_names[1:]
-
-        if "check.%s" % hall_of_fame_index in f:
-            checkfile_path = os.path.join(fit_dir, f)
-            with open(checkfile_path, "r") as checkfile:
-                linecount = 0
-                cv_rms_wrms_info_line = int
-                for line in checkfile.readlines():
-                    if (
-                        line.strip() == "-- Check: individual 0  --"
-                    ):  # % hall_of_fame_index:
-                        cv_rms_wrms_info_line = linecount + 3
-
-                    if linecount == cv_rms_wrms_info_line:
-                        cv = float(line.split()[3])
-                        rms = float(line.split()[4])
-                        wrms = float(line.split()[5])
-                    linecount += 1
+            below_hull_scel_names, below_hull_data = _read_hull_data_file(path)
+        elif kind == "check":
+            cv, rms, wrms = _read_check_file(path)
 
     # Generate the plot
     fig = plt.figure()
@@ -735,10 +1121,8 @@ def plot_clex_hull_data_1_x(
         # format:
         # run casm query -k comp formation_energy hull_dist clex clex_hull_dist -o full_formation_energies.txt
         #            configname    selected           comp(a)    formation_energy    hull_dist(MASTER,atom_frac)        clex()    clex_hull_dist(MASTER,atom_frac)
-        datafile = full_formation_energy_file
-        data = np.genfromtxt(datafile, skip_header=1, usecols=list(range(2, 7))).astype(
-            float
-        )
+        datafile = os.path.join(fit_dir, full_formation_energy_file)
+        _, data = _read_hull_data_file(datafile, columns=range(2, 7))
         composition = data[:, 0]
         dft_formation_energy = data[:, 1]
         clex_formation_energy = data[:, 3]
@@ -760,6 +1144,15 @@ def plot_clex_hull_data_1_x(
     return fig
 
 
+@dj.cache_by_array_digest(maxsize=32)
+def _cached_simplex_corner_factorization(corner_points: np.ndarray):
+    """LU factorization of the transposed, augmented corner matrix of a simplex.
+    Used by simplex_corner_weights to factor each simplex only once.
+    """
+    simplex_corners = np.hstack((corner_points, np.ones((corner_points.shape[0], 1))))
+    return lu_factor(simplex_corners.T)
+
+
 def simplex_corner_weights(
     interior_point: np.ndarray, corner_points: np.ndarray
 ) -> np.ndarray:
@@ -768,21 +1161,30 @@ def simplex_corner_weights(
     Parameters:
     -----------
     interior_point: numpy.ndarray
-        Composition row vector of a point within a hull simplex.
+        Composition row vector of a point within a hull simplex, or a matrix with one such row per point.
     corner_points: numpy.ndarray
-        Matrix of composition row vectors of all corner points of a hull simplex.
+        Matrix of composition row vectors of all corner points of a hull simplex (one more corner than composition axes).
 
     Returns:
     --------
-    weights: numpy.ndarray
-        Vector of weights for each corner point. Matrix multiplying wieghts @ corner_corr_matrix will give the linear combination of simplex correlation vectors which,
+    weights: numpy.ndarray shape(number_interior_points, number_corners)
+        Vector of weights for each corner point, one row per interior point. Matrix multiplying wieghts @ corner_corr_matrix will give the linear combination of simplex correlation vectors which,
         when multiplied with ECI, gives the hull distance of the correlation represented by interior_point.
     """
-    # Add a 1 to the end of interior_point and a column of ones to simplex_corners to enforce that the sum of weights is 1.
-    interior_point = np.array(interior_point).reshape(1, -1)
-    simplex_corners = np.hstack((corner_points, np.ones((simplex_corners.shape[0], 1))))
+    corner_points = np.ascontiguousarray(corner_points, dtype=float)
+    if corner_points.ndim != 2 or corner_points.shape[0] != corner_points.shape[1] + 1:
+        raise ValueError(
+            "corner_points must hold one more corner than composition axes, got shape %s"
+            % (corner_points.shape,)
+        )
+    interior_points = np.reshape(
+        np.asarray(interior_point, dtype=float), (-1, corner_points.shape[1])
+    )
 
-    # Calculate the weights for each simplex corner point.
-    weights = interior_point @ np.linalg.pinv(simplex_corners)
+    # Add a 1 to the end of each interior point and a column of ones to simplex_corners to enforce that the sum of weights is 1.
+    # The corners are factored once; every interior point is then a pair of triangular solves.
+    lu_and_piv = _cached_simplex_corner_factorization(corner_points)
+    interior_points = np.hstack((interior_points, np.ones((interior_points.shape[0], 1))))
+    weights = lu_solve(lu_and_piv, interior_points.T).T
 
     return weights
@@ -1,7 +1,11 @@
+import json
+import os
+import pickle
 import pytest
 import numpy as np
 import djlib.clex.clex as cl
 import thermocore.geometry.hull as thull
+from scipy.interpolate import griddata
 
 
 @pytest.fixture
@@ -24,3 +28,148 @@ def test_stable_chemical_potential_windows_binary(points):
     )
     windows = cl.stable_chemical_potential_windows_binary(hull)
     assert np.allclose(windows, [2.0, 1.0, 1.0])
+
+
+def test_checkhull_multiple_energy_sets():
+    # Test that each column of energies is compared against its own interpolated hull
+
+    hull_comps = np.array([[0.0], [1.0]])
+    hull_energies = np.array([[0.0, 0.0], [0.0, -1.0]])
+    test_comp = np.array([[0.5], [0.25]])
+    test_energy = np.array([[-1.0, 0.0], [0.0, -0.5]])
+    hulldist = cl.checkhull(hull_comps, hull_energies, test_comp, test_energy)
+    assert np.allclose(hulldist, [[-1.0, 0.5], [0.0, -0.25]])
+
+
+def test_hull_interpolation_weights_ternary():
+    # Test that the weights reproduce the test composition and are NaN outside of the hull
+
+    hull_comps = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    test_comp = np.array([[0.25, 0.25], [1.0, 1.0]])
+    vertex_indices, weights = cl.hull_interpolation_weights(hull_comps, test_comp)
+    assert np.allclose(weights[0] @ hull_comps[vertex_indices[0]], test_comp[0])
+    assert np.isclose(np.sum(weights[0]), 1.0)
+    assert np.all(np.isnan(weights[1]))
+
+
+def test_uncalculated_energies_to_nan():
+    # Test that both casm descriptors for uncalculated energies become NaN
+
+    energies = cl.uncalculated_energies_to_nan(np.array([-0.5, None, {}, 0], dtype=object))
+    assert np.allclose(energies, [-0.5, np.nan, np.nan, 0.0], equal_nan=True)
+    assert energies.dtype == float
+
+
+def test_uncalculated_energies_to_nan_numpy_scalars():
+    # Test that numpy scalar energies are kept, not treated as uncalculated
+
+    energies = cl.uncalculated_energies_to_nan(
+        np.array([np.float32(-0.5), np.int64(0), None], dtype=object)
+    )
+    assert np.allclose(energies, [-0.5, 0.0, np.nan], equal_nan=True)
+
+
+@pytest.mark.parametrize("number_axes", [1, 2])
+def test_find_proposed_ground_states_matches_griddata(number_axes):
+    # Test against a direct hull distance calculation for each ECI set
+
+    rng = np.random.default_rng(number_axes)
+    corners = np.vstack((np.zeros(number_axes), np.eye(number_axes)))
+    interior = rng.dirichlet(np.ones(number_axes + 1), 120)[:, :number_axes]
+    comp = np.vstack((corners, interior))
+    corr = np.hstack(
+        (np.ones((comp.shape[0], 1)), comp, rng.normal(size=(comp.shape[0], 5)))
+    )
+    formation_energy = corr @ rng.normal(scale=0.1, size=corr.shape[1])
+    formation_energy = formation_energy.astype(object)
+    uncalculated = rng.choice(np.arange(len(corners), comp.shape[0]), 40, replace=False)
+    formation_energy[uncalculated] = None
+    eci_set = rng.normal(scale=0.1, size=(30, corr.shape[1]))
+
+    calculated = np.flatnonzero(formation_energy != None)
+    hull = thull.full_hull(
+        compositions=comp[calculated],
+        energies=formation_energy[calculated].astype(float),
+    )
+    hull_indices = calculated[thull.lower_hull(hull)[0]]
+    expected = []
+    for eci in eci_set:
+        energies = corr @ eci
+        hull_energies = griddata(
+            comp[hull_indices], energies[hull_indices], comp, method="linear"
+        )
+        hulldist = energies - np.ravel(hull_energies)
+        expected.append(np.flatnonzero(hulldist < -1e-5))
+    expected = np.sort(np.concatenate(expected))
+
+    proposed = cl.find_proposed_ground_states(
+        corr, comp, formation_energy, eci_set, batch_size=7
+    )
+    assert expected.size > 0
+    assert np.array_equal(proposed, expected)
+
+
+def _write_partitioned_run(run_dir, write_partition_files):
+    rng = np.random.default_rng(0)
+    corr = rng.random((12, 3))
+    energies = rng.normal(size=12)
+    data_source = os.path.join(run_dir, "query.json")
+    with open(data_source, "w") as f:
+        json.dump(
+            [
+                {"corr": [row.tolist()], "formation_energy": energy}
+                for row, energy in zip(corr, energies)
+            ],
+            f,
+        )
+    training_set = np.arange(0, 12, 2)
+    test_set = np.arange(1, 12, 2)
+    if write_partition_files:
+        np.savez(
+            os.path.join(run_dir, "training_data.npz"),
+            corr=corr[training_set],
+            formation_energy=energies[training_set],
+        )
+        np.savez(
+            os.path.join(run_dir, "testing_data.npz"),
+            corr=corr[test_set],
+            formation_energy=energies[test_set],
+        )
+    with open(os.path.join(run_dir, "run_info.json"), "w") as f:
+        json.dump(
+            {
+                "training_set": training_set.tolist(),
+                "test_set": test_set.tolist(),
+                "data_source": data_source,
+            },
+            f,
+        )
+    with open(os.path.join(run_dir, "results.pkl"), "wb") as f:
+        pickle.dump({"eci": rng.normal(size=(3, 5))}, f)
+
+
+def test_bayes_train_test_analysis_partition_files(tmp_path):
+    # Test that the npz partitions give the same rms as parsing the original query data
+
+    for name, write_partition_files in (("npz", True), ("json", False)):
+        os.makedirs(tmp_path / name)
+        _write_partitioned_run(str(tmp_path / name), write_partition_files)
+    from_npz = cl.bayes_train_test_analysis(str(tmp_path / "npz"))
+    from_json = cl.bayes_train_test_analysis(str(tmp_path / "json"))
+    for key in ("training_rms", "testing_rms", "eci_mean_testing_rms", "eci_means"):
+        assert np.allclose(from_npz[key], from_json[key])
+
+
+def test_format_stan_executable_script_npz(tmp_path):
+    # Test that the script for an npz data file loads the correlations and the requested energy tag
+
+    data_file = str(tmp_path / "training_data.npz")
+    corr = np.arange(6.0).reshape(3, 2)
+    np.savez(data_file, corr=corr, energy=np.array([-1.0, 0.0, 1.0]))
+    script = cl.format_stan_executable_script(
+        data_file, "stan_model.txt", "results.pkl", 10, energy_tag="energy"
+    )
+    namespace = {"np": np}
+    exec(script.split("# Load Casm Data")[1].split("#Format Stan Model")[0], namespace)
+    assert np.allclose(namespace["corr"], corr)
+    assert np.allclose(namespace["energies"], [-1.0, 0.0, 1.0])
@@ -0,0 +1,26 @@
+import numpy as np
+import djlib.djlib as dj
+
+
+def test_cache_by_array_digest():
+    # Test that arrays with the same contents share one cached, read-only result
+
+    calls = []
+
+    @dj.cache_by_array_digest(maxsize=2)
+    def double(values, scale):
+        calls.append(scale)
+        return values * scale
+
+    values = np.arange(4.0)
+    first = double(values, 2)
+    assert np.allclose(double(values.copy(), 2), [0.0, 2.0, 4.0, 6.0])
+    assert not first.flags.writeable
+    assert len(calls) == 1
+    double(values + 1, 2)
+    double(values, 3)
+    double(values.reshape(2, 2), 2)
+    assert len(calls) == 4
+    # The least recently used entry was dropped
+    double(values, 2)
+    assert len(calls) == 5
@@ -0,0 +1,111 @@
+import os
+import pytest
+import numpy as np
+import thermocore.geometry.hull as thull
+import old.old as old
+
+
+def _write_hull_data_file(path, names, data):
+    with open(path, "w") as f:
+        f.write("#configname " + " ".join("col%d" % i for i in range(data.shape[1])) + "\n")
+        for name, row in zip(names, data):
+            f.write(name + " " + " ".join(str(value) for value in row) + "\n")
+
+
+def _write_check_file(path, cv, rms, wrms):
+    with open(path, "w") as f:
+        f.write("-- Check: individual 0  --\n")
+        f.write("header\n")
+        f.write("Index  #Basis  #Samples  CV  RMS  WRMS\n")
+        f.write("0 5 20 %s %s %s\n" % (cv, rms, wrms))
+
+
+def test_plot_clex_hull_data_1_x(tmp_path):
+    # Test that only the files of the requested hall of fame index are read, and the working directory is left unchanged
+
+    rng = np.random.default_rng(0)
+    names = ["SCEL1_1_1_1_0_0_0/0", "SCEL2_2_1_1_0_0_0/0", "SCEL2_2_1_1_0_0_0/1"]
+    data = {kind: rng.random((3, 9)) for kind in ("dft_gs", "clex_gs", "below_hull")}
+    for kind, kind_data in data.items():
+        _write_hull_data_file(tmp_path / ("fit_1_" + kind), names, kind_data)
+        # Hall of fame index 11 must not be mistaken for index 1
+        _write_hull_data_file(tmp_path / ("fit_11_" + kind), names, kind_data + 1)
+    _write_check_file(tmp_path / "check.1", 0.001, 0.002, 0.003)
+    _write_check_file(tmp_path / "check.11", 0.1, 0.2, 0.3)
+
+    parsed_names, parsed_data = old._read_hull_data_file(str(tmp_path / "fit_1_dft_gs"))
+    assert parsed_names == names
+    assert np.allclose(parsed_data, data["dft_gs"])
+    assert old._read_check_file(str(tmp_path / "check.1")) == (0.001, 0.002, 0.003)
+
+    working_directory = os.getcwd()
+    fig = old.plot_clex_hull_data_1_x(
+        str(tmp_path), 1, full_formation_energy_file=None, custom_title="test"
+    )
+    assert os.getcwd() == working_directory
+
+    ax = fig.axes[0]
+    assert np.allclose(ax.lines[0].get_xydata(), data["dft_gs"][:, [1, 5]])
+    assert np.allclose(ax.lines[1].get_xydata(), data["clex_gs"][:, [1, 8]])
+    assert np.allclose(ax.collections[0].get_offsets(), data["dft_gs"][:, [1, 8]])
+    assert np.allclose(ax.collections[1].get_offsets(), data["below_hull"][:, [1, 7]])
+    assert ax.texts[0].get_text() == "CV:      %.10f\nRMS:    %.10f\nWRMS: %.10f" % (
+        0.001,
+        0.002,
+        0.003,
+    )
+
+
+def test_simplex_corner_weights_unit_triangle():
+    # Test that the weights are the barycentric coordinates of each interior point
+
+    corner_points = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    weights = old.simplex_corner_weights(
+        np.array([[0.2, 0.3], [0.0, 0.0]]), corner_points
+    )
+    assert np.allclose(weights, [[0.5, 0.2, 0.3], [1.0, 0.0, 0.0]])
+    assert np.allclose(
+        old.simplex_corner_weights(np.array([0.2, 0.3]), corner_points),
+        [[0.5, 0.2, 0.3]],
+    )
+
+
+def test_simplex_corner_weights_wrong_number_of_corners():
+    # Test that a corner set that is not a full simplex is rejected
+
+    with pytest.raises(ValueError):
+        old.simplex_corner_weights(
+            np.array([0.5, 0.0]), np.array([[0.0, 0.0], [1.0, 0.0]])
+        )
+
+
+def test_eci_monte_carlo_chain_gpu_matches_cpu():
+    # Test that a seeded chain takes the same steps on the GPU as on the CPU
+
+    pytest.importorskip("cupy")
+    rng = np.random.default_rng(0)
+    comp = rng.random((40, 1))
+    corr = np.hstack((np.ones((40, 1)), comp, comp ** 2, rng.random((40, 2))))
+    initial_eci = np.array([0.0, 0.0, 1.0, -0.1, 0.1])
+    formation_energy_calculated = corr[:30] @ initial_eci + 0.01 * rng.normal(size=30)
+    hull = thull.full_hull(compositions=comp[:30], energies=formation_energy_calculated)
+    dft_hull_indices, _ = thull.lower_hull(hull)
+    chain_args = (
+        corr,
+        formation_energy_calculated,
+        comp,
+        dft_hull_indices,
+        comp[dft_hull_indices],
+        initial_eci,
+        0.01,
+        500,
+        100,
+        50,
+        1e-5,
+    )
+    cpu = old._eci_monte_carlo_chain(*chain_args, seed=3, use_gpu=False)
+    gpu = old._eci_monte_carlo_chain(*chain_args, seed=3, use_gpu=True)
+    assert np.array_equal(cpu[2], gpu[2])
+    assert np.allclose(cpu[0], gpu[0])
+    assert np.allclose(cpu[3], gpu[3])
+    assert np.array_equal(cpu[4], gpu[4])
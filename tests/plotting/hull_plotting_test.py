@@ -0,0 +1,43 @@
+import pytest
+import numpy as np
+import djlib.plotting.hull_plotting as hp
+import thermocore.geometry.hull as thull
+from scipy.spatial import QhullError
+
+
+def _qhull_lower_hull_points(x, y):
+    hull = thull.full_hull(compositions=np.reshape(x, (-1, 1)), energies=y)
+    vertices, _ = thull.lower_hull(hull)
+    return np.unique(np.column_stack((x[vertices], y[vertices])), axis=0)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_lower_hull_2d_matches_thermocore(seed):
+    # Test that the monotone chain finds the same lower hull points as Qhull, on continuous and discrete data
+
+    rng = np.random.default_rng(seed)
+    for trial in range(300):
+        n = rng.integers(3, 60)
+        if trial % 2:
+            x = rng.integers(0, 12, n) / 11
+            y = np.round(rng.normal(size=n), 1)
+        else:
+            x = rng.random(n)
+            y = rng.normal(size=n)
+        try:
+            expected = _qhull_lower_hull_points(x, y)
+        except QhullError:
+            # Qhull rejects flat (collinear) point sets
+            continue
+        vertices = hp.lower_hull_2d(x, y)
+        assert np.all(np.diff(x[vertices]) > 0)
+        points = np.unique(np.column_stack((x[vertices], y[vertices])), axis=0)
+        assert np.array_equal(points, expected)
+
+
+def test_lower_hull_2d_drops_collinear_points():
+    # Test that a point on a hull edge, up to rounding, is not a vertex
+
+    x = np.array([0.0, 0.3, 0.5, 0.7, 1.0])
+    y = np.array([0.0, -1.0, 0.0, 1.0, 3.0])
+    assert np.array_equal(hp.lower_hull_2d(x, y), [0, 1, 3, 4])